@@ -7,21 +7,26 @@ This module provides REST endpoints for:
 - System health checks
 """
 
+import asyncio
 import os
+import threading
 import uuid
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 from contextlib import asynccontextmanager
 
+import orjson
+from cachetools import LRUCache
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from graph.storage import GraphStorage
 from graph.query import QueryEngine
 from graph.rdf import RDFExporter
+from chat.history import ChatMessage
 from chat.nlp import NLPProcessor
 
 
@@ -30,6 +35,18 @@ storage: Optional[GraphStorage] = None
 query_engine: Optional[QueryEngine] = None
 nlp_processor: Optional[NLPProcessor] = None
 
+# Bumped after every ingest so cached function results from older graphs are never reused
+graph_version = 0
+# Filled from worker threads, so access is locked
+function_cache: LRUCache = LRUCache(maxsize=4096)
+function_cache_lock = threading.Lock()
+
+# Node/edge counts captured at ingest time, so health probes don't scan the graph
+graph_stats = {"node_count": 0, "edge_count": 0}
+
+# Free-text searches are too varied to be worth caching
+UNCACHED_FUNCTIONS = {"search_nodes"}
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -64,6 +81,9 @@ async def lifespan(app: FastAPI):
     yield
     
     # Cleanup on shutdown
+    if nlp_processor:
+        await nlp_processor.aclose()
+    
     if storage:
         storage.close()
         print("👋 Disconnected from Neo4j")
@@ -71,6 +91,7 @@ async def lifespan(app: FastAPI):
 
 async def run_connectors():
     """Run all connectors to populate the graph."""
+    global graph_version
     from connectors import DockerComposeConnector, TeamsConnector, KubernetesConnector
     
     data_dir = Path(__file__).parent.parent / "data"
@@ -79,48 +100,42 @@ async def run_connectors():
     storage.clear_graph()
     print("🗑️  Cleared existing graph data")
     
-    # Run Docker Compose connector
-    docker_compose_file = data_dir / "docker-compose.yml"
-    if docker_compose_file.exists():
-        connector = DockerComposeConnector()
-        result = connector.parse(docker_compose_file)
-        
-        for node in result.nodes:
-            storage.upsert_node(node)
-        for edge in result.edges:
-            storage.upsert_edge(edge)
-        
-        print(f"✅ Docker Compose: {len(result.nodes)} nodes, {len(result.edges)} edges")
-    
-    # Run Teams connector
-    teams_file = data_dir / "teams.yaml"
-    if teams_file.exists():
-        connector = TeamsConnector()
-        result = connector.parse(teams_file)
-        
-        for node in result.nodes:
-            storage.upsert_node(node)
-        for edge in result.edges:
-            storage.upsert_edge(edge)
-        
-        print(f"✅ Teams: {len(result.nodes)} nodes, {len(result.edges)} edges")
+    sources = [
+        ("Docker Compose", DockerComposeConnector, data_dir / "docker-compose.yml"),
+        ("Teams", TeamsConnector, data_dir / "teams.yaml"),
+        ("Kubernetes", KubernetesConnector, data_dir / "k8s-deployments.yaml"),
+    ]
+    sources = [source for source in sources if source[2].exists()]
+    
+    # Parse files concurrently
+    results = await asyncio.gather(*(
+        asyncio.to_thread(connector_cls().parse, file_path)
+        for _, connector_cls, file_path in sources
+    ))
+    
+    # Connectors MERGE some of the same node IDs, and concurrent MERGEs without a
+    # uniqueness constraint can create duplicates, so nodes are written one connector at a time
+    for result in results:
+        await asyncio.to_thread(storage.upsert_nodes_bulk, result.nodes)
+    
+    # Edges may point at nodes from other connectors, so write them once all nodes exist.
+    # A single call reuses one session and batches every connector's edges by type.
+    await asyncio.to_thread(
+        storage.upsert_edges_bulk,
+        [edge for result in results for edge in result.edges]
+    )
     
-    # Run Kubernetes connector (bonus)
-    k8s_file = data_dir / "k8s-deployments.yaml"
-    if k8s_file.exists():
-        connector = KubernetesConnector()
-        result = connector.parse(k8s_file)
-        
-        for node in result.nodes:
-            storage.upsert_node(node)
-        for edge in result.edges:
-            storage.upsert_edge(edge)
-        
-        print(f"✅ Kubernetes: {len(result.nodes)} nodes, {len(result.edges)} edges")
+    for (label, _, _), result in zip(sources, results):
+        print(f"✅ {label}: {len(result.nodes)} nodes, {len(result.edges)} edges")
     
     # Create indexes
     storage.create_indexes()
-    print(f"📊 Graph ready: {storage.get_node_count()} nodes, {storage.get_edge_count()} edges")
+    
+    graph_version += 1
+    with function_cache_lock:
+        function_cache.clear()
+    graph_stats.update(query_engine.get_graph_stats())
+    print(f"📊 Graph ready: {graph_stats['node_count']} nodes, {graph_stats['edge_count']} edges")
 
 
 # Create FastAPI app
@@ -193,106 +208,223 @@ async def health_check():
     return {
         "status": "healthy",
         "graph_connected": storage is not None,
-        "node_count": storage.get_node_count() if storage else 0,
-        "edge_count": storage.get_edge_count() if storage else 0
+        **graph_stats,
+        "token_usage": dict(nlp_processor.token_usage) if nlp_processor else {}
     }
 
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Process a natural language chat message."""
-    if not nlp_processor or not query_engine:
-        raise HTTPException(status_code=503, detail="Service not initialized")
+    session_id = await _start_session(request)
+    history_msgs = await _load_history(request, session_id)
     
-    # Generate or reuse session ID
-    session_id = request.session_id or str(uuid.uuid4())
-    
-    if request.clear_context:
-        nlp_processor.clear_context(session_id)
-    
-    # Get function calls from NLP
-    _, function_calls = nlp_processor.process_query(request.message, session_id)
-    
-    # Execute function calls
-    function_results = []
-    nodes_mentioned = []
-    
-    for call in function_calls:
-        result = execute_function(call["function_name"], call["arguments"])
-        function_results.append({
-            "id": call["id"],
-            "function_name": call["function_name"],
-            "result": result
-        })
-        
-        # Track mentioned nodes
-        if isinstance(result, dict) and result.get("id"):
-            nodes_mentioned.append(result["id"])
-        elif isinstance(result, list):
-            for item in result:
-                if isinstance(item, dict) and item.get("id"):
-                    nodes_mentioned.append(item["id"])
-    
-    # Generate response
-    if function_results:
-        response_text = nlp_processor.generate_response(request.message, function_results, session_id)
-    else:
-        # For simple chitchat without function calls, we still need to generate a response
-        # using the history
-        response_text = nlp_processor.generate_response(request.message, [], session_id)
+    # Tool selection, execution and the final answer share one prompt
+    response_text, function_results = await nlp_processor.run_turn(
+        request.message, session_id, dispatch_function, history_msgs
+    )
     
     return ChatResponse(
         response=response_text,
         session_id=session_id,
         function_calls=function_results,
-        nodes_mentioned=nodes_mentioned
+        nodes_mentioned=_nodes_mentioned(function_results)
     )
 
 
-def execute_function(function_name: str, arguments: dict) -> Any:
-    """Execute a graph query function."""
-    if function_name == "get_node":
-        return query_engine.get_node(arguments["node_id"])
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Process a chat message and stream the answer as NDJSON events.
     
-    elif function_name == "list_nodes":
-        return query_engine.get_nodes(arguments["node_type"])
+    The first event carries the session ID, function calls and mentioned nodes;
+    each following event carries a fragment of the response text.
+    """
+    session_id = await _start_session(request)
     
-    elif function_name == "get_downstream":
-        return query_engine.downstream(arguments["node_id"])
+    # Fetch history once and share it between tool selection and the answer
+    history_msgs = await _load_history(request, session_id)
+    content, function_results = await _run_tools(request.message, session_id, history_msgs)
     
-    elif function_name == "get_upstream":
-        return query_engine.upstream(arguments["node_id"])
+    async def events():
+        yield orjson.dumps({
+            "type": "meta",
+            "session_id": session_id,
+            "function_calls": function_results,
+            "nodes_mentioned": _nodes_mentioned(function_results)
+        }) + b"\n"
+        
+        if content and not function_results:
+            # The model answered directly without tools, so skip the second completion
+            await nlp_processor.save_response(session_id, request.message, content)
+            yield orjson.dumps({"type": "token", "content": content}) + b"\n"
+            return
+        
+        async for fragment in nlp_processor.stream_response(
+            request.message, function_results, session_id, history_msgs
+        ):
+            yield orjson.dumps({"type": "token", "content": fragment}) + b"\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+async def _run_tools(
+    message: str,
+    session_id: str,
+    history_msgs: list[ChatMessage]
+) -> tuple[str, list[dict]]:
+    """
+    Select and execute the graph functions for a chat message.
+    
+    Returns:
+        Tuple of (direct model content, function results)
+    """
+    # Start each function call as soon as the NLP stream completes it, so graph
+    # queries run concurrently with each other and with the remaining generation
+    calls = []
+    tasks = []
+    
+    async def run_call(call: dict) -> None:
+        calls.append(call)
+        tasks.append(asyncio.create_task(
+            nlp_processor.run_tool_call(call, dispatch_function)
+        ))
+    
+    content, _ = await nlp_processor.process_query(
+        message, session_id, on_tool_call=run_call, history_msgs=history_msgs
+    )
+    results = await asyncio.gather(*tasks)
     
-    elif function_name == "blast_radius":
-        return query_engine.blast_radius(arguments["node_id"])
+    function_results = [
+        {
+            "id": call["id"],
+            "function_name": call["function_name"],
+            "arguments": call["arguments"],
+            "result": result
+        }
+        for call, result in zip(calls, results)
+    ]
     
-    elif function_name == "find_path":
-        return query_engine.path(arguments["from_node"], arguments["to_node"])
+    return content, function_results
+
+
+async def _start_session(request: ChatRequest) -> str:
+    """Resolve the session ID for a chat message, clearing its context if requested."""
+    if not nlp_processor or not query_engine:
+        raise HTTPException(status_code=503, detail="Service not initialized")
     
-    elif function_name == "get_owner":
-        return query_engine.get_owner(arguments["node_id"])
+    # Generate or reuse session ID
+    session_id = request.session_id or str(uuid.uuid4())
+    
+    if request.clear_context:
+        await nlp_processor.clear_context(session_id)
+    
+    return session_id
+
+
+async def _load_history(request: ChatRequest, session_id: str) -> list[ChatMessage]:
+    """Load a session's recent history, skipping Redis when it must be empty."""
+    if not request.session_id or request.clear_context:
+        return []
+    return await nlp_processor.load_history(session_id)
+
+
+def _nodes_mentioned(function_results: list[dict]) -> list[str]:
+    """Collect the unique node IDs found in function results, in order."""
+    return list(dict.fromkeys(
+        node_id
+        for result in function_results
+        for node_id in _mentioned_node_ids(result["function_name"], result["result"])
+    ))
+
+
+# Where each function's (dict) result keeps its nodes; functions not listed return a node list
+NODE_EXTRACTORS: dict[str, Callable[[dict], list]] = {
+    "get_node": lambda result: [result],
+    "get_owner": lambda result: [result],
+    "blast_radius": lambda result: [
+        result.get("node"), *result.get("upstream", []), *result.get("downstream", [])
+    ],
+    "find_path": lambda result: result.get("nodes", []),
+    "get_oncall": lambda result: [],
+}
+
+
+def _mentioned_node_ids(function_name: str, result: Any):
+    """Yield the IDs of the nodes contained in a function result."""
+    if isinstance(result, dict):
+        # Failed calls (unknown function, invalid arguments) carry no nodes
+        if "error" in result:
+            return
+        extractor = NODE_EXTRACTORS.get(function_name)
+        items = extractor(result) if extractor else [result]
+    elif isinstance(result, list):
+        items = result
+    else:
+        return
     
-    elif function_name == "get_team_assets":
-        team_id = f"team:{arguments['team_name']}"
-        return query_engine.get_team_assets(team_id)
+    for item in items:
+        if isinstance(item, dict) and item.get("id"):
+            yield item["id"]
+
+
+# Graph query functions callable by the LLM, keyed by tool name
+FUNCTION_DISPATCH: dict[str, Callable[[dict], Any]] = {
+    "get_node": lambda args: query_engine.get_node(args["node_id"]),
+    "list_nodes": lambda args: query_engine.get_nodes(args["node_type"]),
+    "get_downstream": lambda args: query_engine.downstream(args["node_id"]),
+    "get_upstream": lambda args: query_engine.upstream(args["node_id"]),
+    "blast_radius": lambda args: query_engine.blast_radius(args["node_id"]),
+    "find_path": lambda args: query_engine.path(args["from_node"], args["to_node"]),
+    "get_owner": lambda args: query_engine.get_owner(args["node_id"]),
+    "get_team_assets": lambda args: query_engine.get_team_assets(f"team:{args['team_name']}"),
+    "get_oncall": lambda args: query_engine.get_oncall(args["node_id"]),
+    "search_nodes": lambda args: query_engine.search_nodes(args["query"]),
+}
+
+
+async def dispatch_function(function_name: str, arguments: dict) -> Any:
+    """Execute a graph query function without blocking the event loop."""
+    # The Neo4j driver is synchronous, so keep graph queries off the event loop
+    return await asyncio.to_thread(execute_function, function_name, arguments)
+
+
+def execute_function(function_name: str, arguments: dict) -> Any:
+    """Execute a graph query function."""
+    handler = FUNCTION_DISPATCH.get(function_name)
+    if handler is None:
+        return {"error": f"Unknown function: {function_name}"}
     
-    elif function_name == "get_oncall":
-        return query_engine.get_oncall(arguments["node_id"])
+    if function_name in UNCACHED_FUNCTIONS:
+        return handler(arguments)
     
-    elif function_name == "search_nodes":
-        return query_engine.search_nodes(arguments["query"])
+    cache_key = (graph_version, function_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+    with function_cache_lock:
+        if cache_key in function_cache:
+            return function_cache[cache_key]
     
-    else:
-        return {"error": f"Unknown function: {function_name}"}
+    # Computed outside the lock; concurrent misses just run the query twice
+    # Functions like get_oncall run several queries; share one session among them
+    with query_engine.scope():
+        result = handler(arguments)
+    with function_cache_lock:
+        function_cache[cache_key] = result
+    return result
+
+
+def _ndjson(rows: Iterator[dict]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON."""
+    for row in rows:
+        yield orjson.dumps(row) + b"\n"
 
 
 @app.get("/graph/nodes")
 async def get_all_nodes():
-    """Get all nodes in the graph."""
+    """Stream all nodes in the graph as NDJSON."""
     if not storage:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
-    return storage.get_all_nodes()
+    return StreamingResponse(_ndjson(storage.iter_all_nodes()), media_type="application/x-ndjson")
 
 
 @app.get("/graph/nodes/{node_type}")
@@ -301,7 +433,11 @@ async def get_nodes_by_type(node_type: str):
     if not query_engine:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
-    return query_engine.get_nodes(node_type)
+    try:
+        return await asyncio.to_thread(query_engine.get_nodes, node_type)
+    except ValueError as e:
+        # Node types that can't be a Neo4j label are rejected before querying
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/graph/node/{node_id:path}")
@@ -310,7 +446,7 @@ async def get_node(node_id: str):
     if not query_engine:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
-    node = query_engine.get_node(node_id)
+    node = await asyncio.to_thread(query_engine.get_node, node_id)
     if not node:
         raise HTTPException(status_code=404, detail=f"Node {node_id} not found")
     
@@ -319,11 +455,11 @@ async def get_node(node_id: str):
 
 @app.get("/graph/edges")
 async def get_all_edges():
-    """Get all edges in the graph."""
+    """Stream all edges in the graph as NDJSON."""
     if not storage:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
-    return storage.get_all_edges()
+    return StreamingResponse(_ndjson(storage.iter_all_edges()), media_type="application/x-ndjson")
 
 
 @app.post("/ingest")
@@ -336,8 +472,7 @@ async def trigger_ingest():
     
     return {
         "status": "success",
-        "node_count": storage.get_node_count(),
-        "edge_count": storage.get_edge_count()
+        **graph_stats
     }
 
 
@@ -347,7 +482,7 @@ async def get_stats():
     if not query_engine:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
-    return query_engine.get_graph_stats()
+    return graph_stats
 
 
 @app.get("/graph/export/rdf")
@@ -357,7 +492,7 @@ async def export_rdf():
         raise HTTPException(status_code=503, detail="Service not initialized")
         
     exporter = RDFExporter(storage)
-    turtle_data = exporter.export_turtle()
+    turtle_data = await asyncio.to_thread(exporter.export_turtle)
     
     return HTMLResponse(
         content=turtle_data,
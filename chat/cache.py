@@ -0,0 +1,310 @@
+"""
+Semantic Cache for LLM results in the Engineering Knowledge Graph.
+
+This module stores query embeddings in a Redis vector index so that
+semantically equivalent questions ("who owns order-service?" and "which team
+owns the order service?") reuse an earlier LLM result instead of calling OpenAI.
+
+Embeddings come from an int8-quantized ONNX export of the model when one is
+present in EMBEDDING_ONNX_DIR (see README), which keeps a cache hit well under
+the cost of the PyTorch model; otherwise sentence-transformers is used.
+"""
+
+import asyncio
+import os
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+import orjson
+import redis
+from cachetools import LRUCache
+from redis.commands.search.field import TagField, TextField, VectorField
+from redis.commands.search.query import Query
+
+try:
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+except ImportError:
+    # Older redis-py releases name the module indexDefinition
+    from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+# Directory holding model.int8.onnx and tokenizer.json for the quantized encoder
+EMBEDDING_ONNX_DIR = Path(os.getenv("EMBEDDING_ONNX_DIR", "onnx"))
+
+INDEX_NAME = "llm_cache_idx"
+KEY_PREFIX = "llm_cache:"
+
+# Cached entries expire with the same 2 week window as chat history
+CACHE_TTL = 1209600
+
+# Queries arriving within EMBED_MAX_WAIT seconds are embedded in one batch
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT = 0.005
+
+
+class OnnxEncoder:
+    """Sentence encoder running a quantized ONNX export with mean pooling."""
+    
+    def __init__(self, model_dir: Path):
+        """
+        Load the ONNX session and tokenizer.
+        
+        Args:
+            model_dir: Directory containing model.int8.onnx and tokenizer.json
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        self._session = ort.InferenceSession(
+            str(model_dir / "model.int8.onnx"),
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        
+        self._tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self._tokenizer.enable_padding()
+        self._tokenizer.enable_truncation(max_length=256)
+    
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts as normalized vectors."""
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self._session.run(None, feeds)[0]
+        
+        # Mean over real tokens, as sentence-transformers pools this model
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+@lru_cache(maxsize=1)
+def _get_encoder() -> Callable[[list[str]], np.ndarray]:
+    """Load the sentence embedding model once per process."""
+    if (EMBEDDING_ONNX_DIR / "model.int8.onnx").exists():
+        return OnnxEncoder(EMBEDDING_ONNX_DIR)
+    
+    from sentence_transformers import SentenceTransformer
+    
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    return lambda texts: model.encode(texts, normalize_embeddings=True)
+
+
+class AsyncEmbedder:
+    """
+    Micro-batching front end for the sentence encoder.
+    
+    Concurrent `embed` calls are queued and a background task runs them through
+    the encoder in batches, which is several times faster than one at a time.
+    """
+    
+    def __init__(self, max_batch: int = EMBED_MAX_BATCH, max_wait: float = EMBED_MAX_WAIT):
+        """
+        Initialize the embedder.
+        
+        Args:
+            max_batch: Maximum number of texts per encoder call
+            max_wait: Seconds to wait for more texts after the first one arrives
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._vectors: LRUCache = LRUCache(maxsize=1024)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+    
+    async def embed(self, text: str) -> bytes:
+        """Embed text as a normalized float32 vector in Redis byte format."""
+        vector = self._vectors.get(text)
+        if vector is not None:
+            return vector
+        
+        # The worker is started lazily so it runs on the serving event loop
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _run(self) -> None:
+        """Drain the queue in batches, resolving each caller's future."""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                vectors = await asyncio.to_thread(_get_encoder(), [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (text, future), vector in zip(batch, vectors):
+                self._vectors[text] = np.asarray(vector, dtype=np.float32).tobytes()
+                if not future.done():
+                    future.set_result(self._vectors[text])
+    
+    async def aclose(self) -> None:
+        """Stop the background batching task."""
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+
+class SemanticCache:
+    """
+    Redis-backed semantic cache for LLM results.
+    
+    Entries are partitioned by a `scope` (which LLM call produced them) and a
+    `context` hash (conversation history, function results), and matched on
+    cosine similarity of the query embedding within that partition.
+    """
+    
+    def __init__(self, redis_url: str, threshold: float = 0.9):
+        """
+        Initialize the semantic cache.
+        
+        Args:
+            redis_url: Redis connection URL (requires the RediSearch module)
+            threshold: Minimum cosine similarity for a cache hit
+        """
+        self._redis = redis.Redis.from_url(redis_url)
+        self._embedder = AsyncEmbedder()
+        self.threshold = threshold
+    
+    @classmethod
+    def connect(cls, redis_url: str) -> Optional["SemanticCache"]:
+        """
+        Create a cache with its vector index, or None if it can't be used.
+        
+        The cache is disabled by setting SEMANTIC_CACHE=false, and also when the
+        Redis server lacks vector search or the embedding model can't be loaded.
+        """
+        if os.getenv("SEMANTIC_CACHE", "true").lower() != "true":
+            return None
+        
+        threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))
+        
+        try:
+            cache = cls(redis_url, threshold)
+            cache.ensure_index()
+            _get_encoder()
+        except (redis.RedisError, ImportError, OSError, RuntimeError) as e:
+            print(f"⚠️  Semantic cache disabled: {e}")
+            return None
+        
+        return cache
+    
+    def ensure_index(self) -> None:
+        """Create the vector index if it doesn't exist yet."""
+        index = self._redis.ft(INDEX_NAME)
+        try:
+            index.info()
+        except redis.ResponseError:
+            index.create_index(
+                [
+                    TagField("scope"),
+                    TagField("context"),
+                    TextField("query"),
+                    VectorField("embedding", "HNSW", {
+                        "TYPE": "FLOAT32",
+                        "DIM": EMBEDDING_DIM,
+                        "DISTANCE_METRIC": "COSINE"
+                    }),
+                ],
+                definition=IndexDefinition(prefix=[KEY_PREFIX], index_type=IndexType.HASH)
+            )
+    
+    async def lookup(self, scope: str, context: str, query: str) -> Optional[Any]:
+        """
+        Find the cached payload for the most similar query in a context.
+        
+        Args:
+            scope: Which LLM call the entry belongs to
+            context: Hash of everything besides the query that shaped the result
+            query: The user query
+        
+        Returns:
+            The cached payload, or None on a miss
+        """
+        # The cache is an optimization, so any failure is treated as a miss
+        try:
+            vector = await self._embedder.embed(query)
+            return await asyncio.to_thread(self._lookup, scope, context, vector)
+        except Exception as e:
+            print(f"⚠️  Semantic cache lookup failed: {e}")
+            return None
+    
+    async def store(self, scope: str, context: str, query: str, payload: Any) -> None:
+        """
+        Cache a JSON-serializable payload for a query in a context.
+        
+        Args:
+            scope: Which LLM call the entry belongs to
+            context: Hash of everything besides the query that shaped the result
+            query: The user query
+            payload: The LLM result to cache
+        """
+        try:
+            vector = await self._embedder.embed(query)
+            await asyncio.to_thread(self._store, scope, context, query, vector, payload)
+        except Exception as e:
+            print(f"⚠️  Semantic cache store failed: {e}")
+    
+    async def aclose(self) -> None:
+        """Stop background embedding and close the Redis connections."""
+        await self._embedder.aclose()
+        self._redis.close()
+    
+    def _lookup(self, scope: str, context: str, vector: bytes) -> Optional[Any]:
+        """Run the KNN search for a query embedding (blocking)."""
+        search = (
+            Query(f"(@scope:{{{scope}}} @context:{{{context}}})=>[KNN 1 @embedding $vec AS distance]")
+            .return_fields("payload", "distance")
+            .dialect(2)
+        )
+        result = self._redis.ft(INDEX_NAME).search(search, query_params={"vec": vector})
+        if not result.docs:
+            return None
+        
+        doc = result.docs[0]
+        # Cosine distance is 1 - similarity
+        if 1 - float(doc.distance) < self.threshold:
+            return None
+        return orjson.loads(doc.payload)
+    
+    def _store(self, scope: str, context: str, query: str, vector: bytes, payload: Any) -> None:
+        """Write a cache entry with its expiry in one pipeline (blocking)."""
+        key = f"{KEY_PREFIX}{uuid.uuid4().hex}"
+        pipe = self._redis.pipeline()
+        pipe.hset(key, mapping={
+            "scope": scope,
+            "context": context,
+            "query": query,
+            "embedding": vector,
+            "payload": orjson.dumps(payload)
+        })
+        pipe.expire(key, CACHE_TTL)
+        pipe.execute()
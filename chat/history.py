@@ -0,0 +1,77 @@
+"""
+Chat History for the Engineering Knowledge Graph.
+
+This module stores conversation history in Redis lists (`chat:<session>` keys,
+oldest message first), one compact msgpack record per message.
+"""
+
+from dataclasses import dataclass
+
+import msgpack
+import redis
+
+
+KEY_PREFIX = "chat:"
+
+# Compact role codes stored with each message
+ROLE_CODES = {"human": "u", "ai": "a"}
+ROLE_TYPES = {code: message_type for message_type, code in ROLE_CODES.items()}
+
+# Messages kept per session and how many of the newest ones a prompt can use
+MAX_MESSAGES = 200
+HISTORY_WINDOW = 50
+
+# Sessions expire after 2 weeks without activity
+HISTORY_TTL = 1209600
+
+
+@dataclass
+class ChatMessage:
+    """A stored chat message."""
+    type: str  # "human" or "ai"
+    content: str
+
+
+class ChatHistory:
+    """
+    Redis-backed history for one chat session.
+    
+    Only the newest HISTORY_WINDOW messages are fetched, and new messages are
+    written in a single pipelined round trip.
+    """
+    
+    def __init__(self, client: redis.Redis, session_id: str):
+        """
+        Initialize the session history.
+        
+        Args:
+            client: Shared Redis client (with its connection pool)
+            session_id: Chat session ID
+        """
+        self._redis = client
+        self.key = f"{KEY_PREFIX}{session_id}"
+    
+    @property
+    def messages(self) -> list[ChatMessage]:
+        """The newest messages of the session, oldest first."""
+        return [
+            ChatMessage(ROLE_TYPES[data["r"]], data["c"])
+            for data in map(msgpack.unpackb, self._redis.lrange(self.key, -HISTORY_WINDOW, -1))
+        ]
+    
+    def add_messages(self, *messages: ChatMessage) -> None:
+        """Append messages, trimming and refreshing the expiry in one round trip."""
+        items = [
+            msgpack.packb({"r": ROLE_CODES[message.type], "c": message.content})
+            for message in messages
+        ]
+        
+        pipe = self._redis.pipeline()
+        pipe.rpush(self.key, *items)
+        pipe.ltrim(self.key, -MAX_MESSAGES, -1)
+        pipe.expire(self.key, HISTORY_TTL)
+        pipe.execute()
+    
+    def clear(self) -> None:
+        """Delete the session's history."""
+        self._redis.delete(self.key)
@@ -6,11 +6,43 @@ using OpenAI's function calling capability.
 """
 
 import os
-import json
-from typing import Any, Optional
+import asyncio
+import hashlib
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 from dataclasses import dataclass
 
-from openai import OpenAI
+import fastjsonschema
+import httpx
+import orjson
+import redis
+import tiktoken
+from cachetools import LRUCache
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from chat.cache import SemanticCache
+from chat.history import ChatHistory, ChatMessage
+from chat.router import IntentRouter
+
+
+MODEL = "gpt-4o-mini"
+
+# Output cap for tool selection; function calls on this closed vocabulary are
+# short, and a direct answer that hits the cap is regenerated without it
+TOOL_MAX_TOKENS = 128
+
+# Token budget for conversation history in a prompt; the system prompt, tool
+# definitions and current query come on top of it
+HISTORY_TOKEN_BUDGET = 1500
+
+# Keep-alive HTTP/2 connection pool limits for OpenAI requests
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# Maximum number of (query, context) pairs kept in the tool-selection cache
+QUERY_CACHE_SIZE = 512
+
+# Tool arguments holding a node ID
+NODE_ARGUMENTS = frozenset({"node_id", "from_node", "to_node"})
 
 
 @dataclass
@@ -26,13 +58,13 @@ class ParsedIntent:
 
 class NLPProcessor:
     """
-    Natural language processor using LangChain and OpenAI.
+    Natural language processor using OpenAI.
     
     Supports persistent chat history via Redis.
     """
     
-    # Available functions for the LLM to call
-    TOOLS = [
+    # Available functions for the LLM to call (a tuple, so it's never mutated per request)
+    TOOLS = (
         {
             "type": "function",
             "function": {
@@ -208,7 +240,7 @@ class NLPProcessor:
                 }
             }
         }
-    ]
+    )
     
     SYSTEM_PROMPT = """You are an assistant for an Engineering Knowledge Graph that contains information about services, databases, caches, and teams in an e-commerce platform.
 
@@ -237,6 +269,17 @@ Do not make up information - only use what the functions return.
 When the user asks a follow-up question, use the conversation context to understand what they're referring to.
 """
     
+    # Request payload pieces built once and shared by every OpenAI call. Every
+    # request starts with the same tools + system prompt prefix (no per-session
+    # data), which lets OpenAI's automatic prompt caching reuse its prefill.
+    _SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+    
+    # Compiled argument validators for each tool's JSON schema
+    _VALIDATORS = {
+        tool["function"]["name"]: fastjsonschema.compile(tool["function"]["parameters"])
+        for tool in TOOLS
+    }
+    
     def __init__(self, api_key: Optional[str] = None):
         """
         Initialize the NLP processor.
@@ -252,127 +295,535 @@ When the user asks a follow-up question, use the conversation context to underst
         if not self.redis_url:
             raise ValueError("REDIS_URL environment variable not set")
             
-        self.client = OpenAI(api_key=self.api_key)
+        # Each processor owns its connection pool, since aclose() shuts it down
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=DefaultAsyncHttpxClient(http2=True, limits=HTTP_LIMITS)
+        )
+        
+        # Tool selection can run on a cheaper model than the final answer
+        self.tool_model = os.getenv("TOOL_MODEL", MODEL)
+        self.answer_model = os.getenv("ANSWER_MODEL", MODEL)
+        
+        # Tokenizer used to keep history within HISTORY_TOKEN_BUDGET; stored
+        # messages recur on every turn, so their counts are memoized
+        self._encoding = tiktoken.encoding_for_model(MODEL)
+        self._token_counts: LRUCache = LRUCache(maxsize=4096)
+        
+        # Tool-selection results keyed by (normalized query, conversation context hash)
+        self._query_cache: LRUCache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+        
+        # Deterministic routes for simple questions naming a known node
+        self._router = IntentRouter.from_prompt(self.SYSTEM_PROMPT)
+        
+        # Shared cache matching semantically equivalent queries (None when unavailable)
+        self._semantic_cache = SemanticCache.connect(self.redis_url)
+        
+        # Running token counts across all completions (reported by /health)
+        self.token_usage: Counter = Counter()
         
-        # We will initialize history per session request
+        # One connection pool shared by every session's history
+        self._redis = redis.Redis.from_url(self.redis_url, max_connections=64)
     
-    def _get_history(self, session_id: str):
+    def _get_history(self, session_id: str) -> ChatHistory:
         """Get Redis-backed chat history."""
-        from langchain_community.chat_message_histories import RedisChatMessageHistory
-        
-        return RedisChatMessageHistory(
-            session_id=session_id,
-            url=self.redis_url,
-            # Data expiry (optional, e.g., 2 weeks)
-            ttl=1209600
-        )
+        return ChatHistory(self._redis, session_id)
 
-    def process_query(self, query: str, session_id: str) -> tuple[str, list[dict]]:
+    async def process_query(
+        self,
+        query: str,
+        session_id: str,
+        on_tool_call: Optional[Callable[[dict], Awaitable[None]]] = None,
+        history_msgs: Optional[list[ChatMessage]] = None
+    ) -> tuple[str, list[dict]]:
         """
         Process a natural language query and return function calls to execute.
+        
+        The completion is streamed, so each function call is handed to
+        `on_tool_call` as soon as its arguments are complete, letting the caller
+        run graph queries while the model is still generating the remaining calls.
+        The callback is invoked for every returned call, including cached ones.
+        
+        Nothing is written to history here; the query is stored together with
+        its answer by run_turn, stream_response or save_response.
+        Pass `history_msgs` from load_history to reuse one fetch across a turn.
         """
-        history = self._get_history(session_id)
+        if history_msgs is None:
+            history_msgs = await self.load_history(session_id)
+        
+        # Construct message list for OpenAI from recent history (limit context window)
+        # Function calls aren't stored, so context relies on text content only.
+        messages = self._build_messages(history_msgs, query)
         
-        # Add user message
-        history.add_user_message(query)
+        return await self._select_tools(query, messages, on_tool_call)
+    
+    async def run_turn(
+        self,
+        query: str,
+        session_id: str,
+        dispatch: Callable[[str, dict], Awaitable[Any]],
+        history_msgs: Optional[list[ChatMessage]] = None
+    ) -> tuple[str, list[dict]]:
+        """
+        Answer a query in a single pass: select tools, run them, respond.
         
-        # Construct message list for OpenAI
-        # We need to convert LangChain messages to OpenAI format
-        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        The prompt is built from history once; the assistant's tool calls and
+        their results are appended to it as `role: "tool"` messages for the
+        final completion. Only the query and final answer are stored in history.
         
-        # Get recent history (limit context window)
-        lc_messages = history.messages[-10:] 
+        Args:
+            query: The user query
+            session_id: Chat session ID
+            dispatch: Async callable running a graph function by name and arguments
+            history_msgs: Already loaded history (fetched when omitted)
         
-        for msg in lc_messages:
-            role = "user" if msg.type == "human" else "assistant"
-            # Note: LangChain stores function calls differently, but for simplicity
-            # in this hybrid approach, we'll mainly rely on text content for context
-            # or we could fully parse them.
-            # Ideally we'd validly reconstruct tool calls.
-            # For now, let's just pass text content to keep context.
-            messages.append({"role": role, "content": msg.content})
+        Returns:
+            Tuple of (response text, function results)
+        """
+        if history_msgs is None:
+            history_msgs = await self.load_history(session_id)
+        messages = self._build_messages(history_msgs, query)
+        
+        content, function_calls = await self._select_tools(query, messages)
+        if not function_calls and content:
+            # The model answered directly, so there's nothing left to generate
+            await self.save_response(session_id, query, content)
+            return content, []
+        
+        function_results = await self.execute_tool_calls(function_calls, dispatch)
+        
+        context = self._response_context(messages, function_results)
+        response_text = await self._semantic_lookup("response", context, query)
+        
+        if response_text is None:
+            self._add_tool_messages(messages, function_results, content)
             
-        # Add current user query (it's already in history but we're building the prompt)
-        # Actually history.messages includes the one we just added.
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.answer_model,
+                    messages=messages,
+                    tools=self.TOOLS,
+                    tool_choice="none"
+                )
+            except Exception as e:
+                return f"Error generating response: {str(e)}", function_results
+            
+            self._record_usage(response.usage)
+            response_text = response.choices[0].message.content or ""
+            await self._semantic_store("response", context, query, response_text)
+        
+        await self.save_response(session_id, query, response_text)
+        return response_text, function_results
+    
+    async def _select_tools(
+        self,
+        query: str,
+        messages: list[dict],
+        on_tool_call: Optional[Callable[[dict], Awaitable[None]]] = None
+    ) -> tuple[str, list[dict]]:
+        """Ask the model which function calls answer the query, using the router and caches first."""
+        # Simple questions about a named node don't need the model (or the
+        # conversation context) to pick their function
+        routed = self._router.route(query)
+        if routed:
+            call = {"id": "call_routed", **routed}
+            if on_tool_call:
+                await on_tool_call(call)
+            return "", [call]
+        
+        # Identical (or semantically equivalent) questions asked in the same
+        # context resolve to the same tool calls
+        cache_key = self._query_cache_key(query, messages[1:-1])
+        cached = self._query_cache.get(cache_key)
+        
+        # Similar questions about different nodes embed closely, so semantic
+        # matches are also keyed on the nodes the query names
+        entities = self._router.mentions(query)
+        semantic_context = self._context_hash(cache_key[1], entities)
+        if cached is None:
+            payload = await self._semantic_lookup("tools", semantic_context, query)
+            if payload is not None:
+                cached = (payload["content"], payload["function_calls"])
+                self._query_cache[cache_key] = cached
+        
+        if cached is not None:
+            if on_tool_call:
+                for call in cached[1]:
+                    await on_tool_call(call)
+            return cached
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                tools=self.TOOLS,
-                tool_choice="auto"
-            )
+            stream = await self._tool_completion(messages, max_tokens=TOOL_MAX_TOKENS)
+            content, function_calls, finish_reason = await self._collect_stream(stream, on_tool_call)
             
-            message = response.choices[0].message
-            
-            # Extract function calls
-            function_calls = []
-            if message.tool_calls:
-                for tool_call in message.tool_calls:
-                    function_calls.append({
-                        "id": tool_call.id,
-                        "function_name": tool_call.function.name,
-                        "arguments": json.loads(tool_call.function.arguments)
-                    })
+            if finish_reason == "length":
+                # The cap cut the output short; regenerate without it, only
+                # handing out calls that weren't already started
+                started = {self._call_key(call) for call in function_calls}
+                
+                async def on_new_call(call: dict) -> None:
+                    if on_tool_call and self._call_key(call) not in started:
+                        await on_tool_call(call)
+                
+                stream = await self._tool_completion(messages)
+                content, function_calls, _ = await self._collect_stream(stream, on_new_call)
             
             # We DON'T add the intermediate assistant message (with tool calls) to history 
             # to avoid cluttering human-readable history, OR we can if we want full debug.
             # For this simple implementation, we'll only store the FINAL response in history.
             
-            return message.content or "", function_calls
+            result = (content, function_calls)
+            self._query_cache[cache_key] = result
+            if self._grounded(function_calls, entities):
+                await self._semantic_store("tools", semantic_context, query, {
+                    "content": content,
+                    "function_calls": function_calls
+                })
+            return result
             
         except Exception as e:
-            return f"Error processing query: {str(e)}", []
+            # Callers fall back to answering without tools, so don't surface this as a direct answer
+            print(f"❌ Error processing query: {e}")
+            return "", []
+    
+    async def _tool_completion(self, messages: list[dict], max_tokens: Optional[int] = None):
+        """Start a streamed tool-selection completion."""
+        return await self.client.chat.completions.create(
+            model=self.tool_model,
+            messages=messages,
+            tools=self.TOOLS,
+            tool_choice="auto",
+            parallel_tool_calls=True,
+            temperature=0,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+    
+    async def run_tool_call(self, call: dict, dispatch: Callable[[str, dict], Awaitable[Any]]) -> Any:
+        """Run one function call, or return its validation error without dispatching it."""
+        if "error" in call:
+            return {"error": call["error"]}
+        return await dispatch(call["function_name"], call["arguments"])
+    
+    def _validate_call(self, call: dict) -> None:
+        """Check a call's arguments against its tool schema, recording any error on the call."""
+        validator = self._VALIDATORS.get(call["function_name"])
+        if validator is None:
+            call["error"] = f"Unknown function: {call['function_name']}"
+            return
+        
+        try:
+            validator(call["arguments"])
+        except fastjsonschema.JsonSchemaException as e:
+            call["error"] = f"Invalid arguments for {call['function_name']}: {e.message}"
+    
+    def _grounded(self, function_calls: list[dict], entities: tuple[str, ...]) -> bool:
+        """
+        Whether every argument of the calls is safe to reuse for similar queries.
+        
+        Node arguments must be among the nodes named in the query, so a match
+        keyed on the same nodes gets the same arguments; free-text arguments
+        like search terms never are.
+        """
+        for call in function_calls:
+            for key, value in call["arguments"].items():
+                if key == "node_type":
+                    continue
+                if key == "team_name":
+                    value = f"team:{value}"
+                elif key not in NODE_ARGUMENTS:
+                    return False
+                if value not in entities:
+                    return False
+        return True
+    
+    def _call_key(self, call: dict) -> tuple[str, bytes]:
+        """Identify a function call by name and arguments."""
+        return call["function_name"], orjson.dumps(call["arguments"], option=orjson.OPT_SORT_KEYS)
     
-    def generate_response(
+    async def execute_tool_calls(
         self,
-        query: str,
-        function_results: list[dict],
-        session_id: str
-    ) -> str:
+        function_calls: list[dict],
+        dispatch: Callable[[str, dict], Awaitable[Any]]
+    ) -> list[dict]:
         """
-        Generate a natural language response based on function results.
+        Execute independent function calls concurrently.
+        
+        Args:
+            function_calls: Calls returned by process_query
+            dispatch: Async callable running a graph function by name and arguments
+        
+        Returns:
+            Function results paired with their tool call IDs and arguments, in call order
+        """
+        results = await asyncio.gather(*(
+            self.run_tool_call(call, dispatch)
+            for call in function_calls
+        ))
+        
+        return [
+            {
+                "id": call["id"],
+                "function_name": call["function_name"],
+                "arguments": call["arguments"],
+                "result": result
+            }
+            for call, result in zip(function_calls, results)
+        ]
+    
+    async def _collect_stream(
+        self,
+        stream,
+        on_tool_call: Optional[Callable[[dict], Awaitable[None]]] = None
+    ) -> tuple[str, list[dict], Optional[str]]:
+        """
+        Assemble text content and function calls from a streamed completion.
+        
+        Tool calls are streamed one after another by index, so a call is complete
+        once a higher index starts or the stream ends. If the stream stopped at
+        the token limit, the last call is incomplete and is dropped. Calls whose
+        arguments don't match their tool schema carry an "error" instead of
+        being run (see run_tool_call).
+        
+        Returns:
+            Tuple of (content, function calls, finish reason)
         """
+        finish_reason = None
+        content_parts = []
+        function_calls = []
+        pending: dict[int, dict] = {}
+        
+        async def finish(index: int) -> None:
+            tool_call = pending.pop(index)
+            call = {
+                "id": tool_call["id"],
+                "function_name": tool_call["name"],
+                "arguments": {}
+            }
+            try:
+                call["arguments"] = orjson.loads(tool_call["arguments"] or "{}")
+            except orjson.JSONDecodeError:
+                call["error"] = f"Malformed arguments for {tool_call['name']}"
+            else:
+                self._validate_call(call)
+            function_calls.append(call)
+            if on_tool_call:
+                await on_tool_call(call)
+        
+        async for chunk in stream:
+            if not chunk.choices:
+                # The final chunk carries only usage
+                self._record_usage(chunk.usage)
+                continue
+            delta = chunk.choices[0].delta
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            
+            if delta.content:
+                content_parts.append(delta.content)
+            
+            for tool_call in delta.tool_calls or []:
+                if tool_call.index not in pending:
+                    for index in sorted(i for i in pending if i < tool_call.index):
+                        await finish(index)
+                    pending[tool_call.index] = {"id": "", "name": "", "arguments": ""}
+                
+                entry = pending[tool_call.index]
+                if tool_call.id:
+                    entry["id"] = tool_call.id
+                if tool_call.function:
+                    entry["name"] += tool_call.function.name or ""
+                    entry["arguments"] += tool_call.function.arguments or ""
+        
+        if finish_reason == "length":
+            pending.clear()
+        for index in sorted(pending):
+            await finish(index)
+        
+        return "".join(content_parts), function_calls, finish_reason
+    
+    async def load_history(self, session_id: str) -> list[ChatMessage]:
+        """Fetch the recent messages of a session (one Redis round trip)."""
         history = self._get_history(session_id)
-        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        return await asyncio.to_thread(lambda: history.messages)
+    
+    def _build_messages(self, history_msgs: list[ChatMessage], query: str) -> list[dict]:
+        """
+        Build the OpenAI prompt from the system message, stored history and query.
+        
+        Walks from the newest message backwards and stops once HISTORY_TOKEN_BUDGET
+        is exhausted. The query is always kept.
+        The list is filled newest-first and reversed in place, so the prompt is
+        materialized exactly once.
+        """
+        budget = HISTORY_TOKEN_BUDGET
+        messages = [{"role": "user", "content": query}]
         
-        # Reconstruct context
-        lc_messages = history.messages[-10:]
-        for msg in lc_messages:
+        for msg in reversed(history_msgs):
+            tokens = self._token_count(msg.content or "")
+            if tokens > budget:
+                break
+            budget -= tokens
             role = "user" if msg.type == "human" else "assistant"
             messages.append({"role": role, "content": msg.content})
-            
-        # Appending function results effectively as "system" or "tool" context for the final generation
-        # Since we aren't using the full tool-call history flow in LangChain here,
-        # we can inject the results as a system message context
         
-        results_context = "\n\nFunction Results:\n"
-        for result in function_results:
-            results_context += f"Function: {result['function_name']}\nResult: {json.dumps(result['result'])}\n\n"
-            
-        messages.append({
-            "role": "system", 
-            "content": f"The user asked: '{query}'.\nHere is the data obtained from the system to answer the question:\n{results_context}\n\nProvide a helpful, concise response based ONLY on this data."
-        })
+        messages.append(self._SYSTEM_MESSAGE)
+        messages.reverse()
+        return messages
+    
+    def _token_count(self, text: str) -> int:
+        """Count the tokens in a message, memoized by content."""
+        count = self._token_counts.get(text)
+        if count is None:
+            count = self._token_counts[text] = len(self._encoding.encode(text))
+        return count
+    
+    def _record_usage(self, usage) -> None:
+        """Add a completion's token usage to the running totals."""
+        if not usage:
+            return
+        
+        self.token_usage["prompt_tokens"] += usage.prompt_tokens
+        self.token_usage["completion_tokens"] += usage.completion_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details and details.cached_tokens:
+            self.token_usage["cached_tokens"] += details.cached_tokens
+    
+    def _query_cache_key(self, query: str, context: list[dict]) -> tuple[str, str]:
+        """Build the tool-selection cache key from the query and prior messages."""
+        normalized = " ".join(query.lower().split())
+        return normalized, self._context_hash(context)
+    
+    def _context_hash(self, *parts: Any) -> str:
+        """Hash everything besides the query that shapes an LLM result."""
+        return hashlib.blake2b(orjson.dumps(parts), digest_size=16).hexdigest()
+    
+    def _response_context(self, messages: list[dict], function_results: list[dict]) -> str:
+        """Hash the prior conversation and function results behind a response."""
+        results = [(result["function_name"], result["result"]) for result in function_results]
+        return self._context_hash(messages[1:-1], results)
+    
+    async def _semantic_lookup(self, scope: str, context: str, query: str) -> Optional[Any]:
+        """Look a query up in the semantic cache, if it's enabled."""
+        if not self._semantic_cache:
+            return None
+        return await self._semantic_cache.lookup(scope, context, query)
+    
+    async def _semantic_store(self, scope: str, context: str, query: str, payload: Any) -> None:
+        """Store an LLM result in the semantic cache, if it's enabled."""
+        if self._semantic_cache:
+            await self._semantic_cache.store(scope, context, query, payload)
+    
+    async def stream_response(
+        self,
+        query: str,
+        function_results: list[dict],
+        session_id: str,
+        history_msgs: Optional[list[ChatMessage]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a natural language response based on function results.
+        
+        Yields text fragments as the model produces them; the query and complete
+        response are added to history once the stream finishes.
+        """
+        if history_msgs is None:
+            history_msgs = await self.load_history(session_id)
+        messages = self._build_messages(history_msgs, query)
+        
+        context = self._response_context(messages, function_results)
+        cached = await self._semantic_lookup("response", context, query)
+        if cached is not None:
+            await self.save_response(session_id, query, cached)
+            yield cached
+            return
+        
+        self._add_tool_messages(messages, function_results)
+        parts = []
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages
+            stream = await self.client.chat.completions.create(
+                model=self.answer_model,
+                messages=messages,
+                tools=self.TOOLS,
+                tool_choice="none",
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
-            response_text = response.choices[0].message.content or ""
-            
-            # Add final response to history
-            history.add_ai_message(response_text)
-            
-            return response_text
+            async for chunk in stream:
+                if not chunk.choices:
+                    self._record_usage(chunk.usage)
+                elif chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
             
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            yield f"Error generating response: {str(e)}"
+            return
+        
+        # Add the query and final response to history
+        response_text = "".join(parts)
+        await self.save_response(session_id, query, response_text)
+        await self._semantic_store("response", context, query, response_text)
+    
+    def _add_tool_messages(
+        self,
+        messages: list[dict],
+        function_results: list[dict],
+        content: Optional[str] = None
+    ) -> None:
+        """
+        Append the assistant's function calls and their results to the prompt.
+        
+        Results go in `role: "tool"` messages answering the assistant's
+        tool_calls message, so the model sees them in OpenAI's native format.
+        """
+        if not function_results:
+            return
+        
+        messages.append({
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": [
+                {
+                    "id": result["id"],
+                    "type": "function",
+                    "function": {
+                        "name": result["function_name"],
+                        "arguments": orjson.dumps(result["arguments"]).decode()
+                    }
+                }
+                for result in function_results
+            ]
+        })
+        
+        # Each result is serialized exactly once
+        messages.extend(
+            {
+                "role": "tool",
+                "tool_call_id": result["id"],
+                "content": orjson.dumps(result["result"]).decode()
+            }
+            for result in function_results
+        )
+    
+    async def save_response(self, session_id: str, query: str, response_text: str) -> None:
+        """Record a query and its answer in history with a single pipelined write."""
+        await asyncio.to_thread(
+            self._get_history(session_id).add_messages,
+            ChatMessage("human", query),
+            ChatMessage("ai", response_text)
+        )
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections and the semantic cache."""
+        await self.client.close()
+        if self._semantic_cache:
+            await self._semantic_cache.aclose()
     
-    def clear_context(self, session_id: str) -> None:
+    async def clear_context(self, session_id: str) -> None:
         """Clear conversation history."""
         history = self._get_history(session_id)
-        history.clear()
+        await asyncio.to_thread(history.clear)
 
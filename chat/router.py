@@ -0,0 +1,181 @@
+"""
+Intent Router for the Engineering Knowledge Graph.
+
+This module maps simple, unambiguous questions ("who owns order-service?",
+"list all databases") straight to a single graph function, so they are
+answered without asking the LLM to pick a tool. Anything it doesn't
+recognize, including unknown node names, is left to the LLM.
+"""
+
+import re
+from typing import Callable, Optional
+
+
+# Node types as written in the system prompt's node list, mapped to ID prefixes
+PROMPT_NODE_TYPES = {
+    "Services": "service",
+    "Databases": "database",
+    "Caches": "cache",
+    "Teams": "team",
+}
+
+# Plural forms accepted by "list all ..." questions
+LIST_TYPES = {"services": "service", "databases": "database", "caches": "cache", "teams": "team"}
+
+NODE = r"(?:the )?([\w:-]+(?: (?:service|db|database|cache|team))?)"
+
+# (pattern, function name, argument builder); builders return None to defer to the LLM
+ROUTES: list[tuple[str, str, Callable[["IntentRouter", tuple], Optional[dict]]]] = [
+    (
+        rf"(?:who owns|who is the owner of|what team owns|which team owns) {NODE}",
+        "get_owner",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"(?:who is|who's) on[- ]?call for {NODE}",
+        "get_oncall",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"(?:what is the )?blast radius (?:of|for) {NODE}",
+        "blast_radius",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"what (?:breaks|would break|fails) if {NODE} (?:goes down|fails|is down)",
+        "get_upstream",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"what depends on {NODE}",
+        "get_upstream",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"what does {NODE} depend on",
+        "get_downstream",
+        lambda router, groups: router.node_args("node_id", groups[0])
+    ),
+    (
+        rf"how does {NODE} connect to {NODE}",
+        "find_path",
+        lambda router, groups: router.path_args(groups[0], groups[1])
+    ),
+    (
+        r"(?:list|show)(?: me)? (?:all )?(?:the )?(services|databases|caches|teams)",
+        "list_nodes",
+        lambda router, groups: {"node_type": LIST_TYPES[groups[0].lower()]}
+    ),
+]
+
+
+class IntentRouter:
+    """
+    Regex router from simple questions to graph function calls.
+    
+    All routes are compiled into one alternation, so a query is matched with a
+    single scan; the route is identified by its named outer group.
+    """
+    
+    def __init__(self, node_ids: dict[str, str]):
+        """
+        Initialize the router.
+        
+        Args:
+            node_ids: Known node names (e.g. "order-service") mapped to node IDs
+        """
+        self.node_ids = node_ids
+        self._known_ids = set(node_ids.values())
+        
+        # Any known node name (hyphens or spaces) or ID, longest first, as a whole word
+        mentions = sorted(
+            [re.escape(name).replace(r"\-", "[- ]") for name in node_ids]
+            + [re.escape(node_id) for node_id in self._known_ids],
+            key=len,
+            reverse=True
+        )
+        self._mention_pattern = (
+            re.compile(rf"(?<![\w-])(?:{'|'.join(mentions)})(?![\w-])", re.IGNORECASE)
+            if mentions else None
+        )
+        
+        self._pattern = re.compile(
+            "|".join(f"(?P<r{i}>{pattern})" for i, (pattern, _, _) in enumerate(ROUTES)),
+            re.IGNORECASE
+        )
+        
+        # Slice of match.groups() holding each route's inner groups
+        self._group_slices = []
+        offset = 0
+        for pattern, _, _ in ROUTES:
+            count = re.compile(pattern).groups
+            self._group_slices.append(slice(offset + 1, offset + 1 + count))
+            offset += 1 + count
+    
+    @classmethod
+    def from_prompt(cls, prompt: str) -> "IntentRouter":
+        """Build a router from the node list in a system prompt ("- Services: a, b")."""
+        node_ids = {}
+        for line in prompt.splitlines():
+            label, _, names = line.removeprefix("- ").partition(":")
+            node_type = PROMPT_NODE_TYPES.get(label.strip())
+            if node_type and names.strip():
+                for name in names.split(","):
+                    node_ids[name.strip().lower()] = f"{node_type}:{name.strip()}"
+        return cls(node_ids)
+    
+    def route(self, query: str) -> Optional[dict]:
+        """
+        Match a query to a single function call.
+        
+        Args:
+            query: The user query
+        
+        Returns:
+            Dict with function_name and arguments, or None if the LLM should decide
+        """
+        match = self._pattern.fullmatch(query.strip().rstrip("?.! "))
+        if not match:
+            return None
+        
+        index = int(match.lastgroup[1:])
+        _, function_name, build_args = ROUTES[index]
+        groups = match.groups()[self._group_slices[index]]
+        
+        arguments = build_args(self, groups)
+        if arguments is None:
+            return None
+        return {"function_name": function_name, "arguments": arguments}
+    
+    def resolve(self, name: str) -> Optional[str]:
+        """Resolve a node mention ("order-service", "payment service", "database:users-db") to its ID."""
+        name = name.strip().lower()
+        if name in self._known_ids:
+            return name
+        
+        hyphenated = "-".join(name.split())
+        for candidate in (hyphenated, f"{hyphenated}-service"):
+            if candidate in self.node_ids:
+                return self.node_ids[candidate]
+        return None
+    
+    def mentions(self, query: str) -> tuple[str, ...]:
+        """IDs of the known nodes named anywhere in a query, sorted."""
+        if not self._mention_pattern:
+            return ()
+        return tuple(sorted({
+            self.resolve(match.group(0).replace(" ", "-"))
+            for match in self._mention_pattern.finditer(query)
+        }))
+    
+    def node_args(self, key: str, name: str) -> Optional[dict]:
+        """Build single-node arguments, or None if the node is unknown."""
+        node_id = self.resolve(name)
+        return {key: node_id} if node_id else None
+    
+    def path_args(self, source: str, target: str) -> Optional[dict]:
+        """Build find_path arguments, or None if either node is unknown."""
+        from_node, to_node = self.resolve(source), self.resolve(target)
+        if not from_node or not to_node:
+            return None
+        return {"from_node": from_node, "to_node": to_node}
@@ -107,7 +107,7 @@ class EKGChat {
         const loadingId = this.addLoadingMessage();
 
         try {
-            const response = await fetch('/chat', {
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -118,19 +118,39 @@ class EKGChat {
                 }),
             });
 
-            const data = await response.json();
-
-            // Store new session ID if provided
-            if (data.session_id) {
-                this.sessionId = data.session_id;
-                localStorage.setItem('ekg_session_id', this.sessionId);
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat request failed: ${response.status}`);
             }
 
-            // Remove loading
-            this.removeMessage(loadingId);
+            // Render the response progressively as fragments arrive
+            let text = '';
+            let textElement = null;
+
+            await this.readNdjson(response, (event) => {
+                if (event.type === 'meta') {
+                    // Store new session ID if provided
+                    if (event.session_id) {
+                        this.sessionId = event.session_id;
+                        localStorage.setItem('ekg_session_id', this.sessionId);
+                    }
+                    return;
+                }
 
-            // Add response
-            this.addMessage(data.response, 'assistant');
+                if (!textElement) {
+                    this.removeMessage(loadingId);
+                    const messageId = this.addMessage('', 'assistant');
+                    textElement = document.getElementById(messageId).querySelector('.message-text');
+                }
+
+                text += event.content;
+                textElement.innerHTML = this.formatMessage(text);
+                this.scrollToBottom();
+            });
+
+            if (!textElement) {
+                this.removeMessage(loadingId);
+                this.addMessage(text, 'assistant');
+            }
 
         } catch (error) {
             this.removeMessage(loadingId);
@@ -290,8 +310,10 @@ class EKGChat {
                 fetch('/graph/edges')
             ]);
 
-            const nodes = await nodesRes.json();
-            const edges = await edgesRes.json();
+            const [nodes, edges] = await Promise.all([
+                this.parseNdjson(nodesRes),
+                this.parseNdjson(edgesRes)
+            ]);
 
             return { nodes, edges };
         } catch (error) {
@@ -300,6 +322,33 @@ class EKGChat {
         }
     }
 
+    async readNdjson(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+
+            if (done) break;
+        }
+
+        if (buffer.trim()) {
+            onEvent(JSON.parse(buffer));
+        }
+    }
+
+    async parseNdjson(response) {
+        const rows = [];
+        await this.readNdjson(response, row => rows.push(row));
+        return rows;
+    }
+
     async renderGraph() {
         const data = await this.fetchGraphData();
 
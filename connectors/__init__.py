@@ -1,6 +1,6 @@
 """Connectors package for parsing infrastructure configuration files."""
 
-from .base import Node, Edge, ConnectorResult, BaseConnector, ConnectorRegistry
+from .base import Node, Edge, NodeBatch, ConnectorResult, BaseConnector, ConnectorRegistry
 from .docker_compose import DockerComposeConnector
 from .teams import TeamsConnector
 from .kubernetes import KubernetesConnector
@@ -8,6 +8,7 @@ from .kubernetes import KubernetesConnector
 __all__ = [
     "Node",
     "Edge", 
+    "NodeBatch",
     "ConnectorResult",
     "BaseConnector",
     "ConnectorRegistry",
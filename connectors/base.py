@@ -5,13 +5,33 @@ This module defines the abstract interface that all connectors must implement,
 along with the Node and Edge data structures used throughout the system.
 """
 
+import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
-from typing import Any, Optional
+from itertools import repeat
+from types import MappingProxyType
+from typing import Any, ClassVar, Iterable, Mapping, Optional
 from pathlib import Path
 
+import yaml
 
-@dataclass
+# libyaml's C loader when PyYAML was built with it; same safe semantics
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Shared read-only properties for the many nodes and edges that have none
+EMPTY_PROPERTIES: Mapping[str, Any] = MappingProxyType({})
+
+
+def _pickled_properties(properties: Mapping[str, Any]) -> tuple:
+    """Constructor argument for properties; omitted when empty so unpickling restores EMPTY_PROPERTIES."""
+    return (dict(properties),) if properties else ()
+
+
+@dataclass(slots=True, frozen=True)
 class Node:
     """
     Represents a node in the knowledge graph.
@@ -25,7 +45,7 @@ class Node:
     id: str
     type: str
     name: str
-    properties: dict[str, Any] = field(default_factory=dict)
+    properties: Mapping[str, Any] = field(default_factory=lambda: EMPTY_PROPERTIES)
     
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary format."""
@@ -33,7 +53,7 @@ class Node:
             "id": self.id,
             "type": self.type,
             "name": self.name,
-            "properties": self.properties
+            "properties": dict(self.properties)
         }
     
     @classmethod
@@ -45,9 +65,13 @@ class Node:
             name=data["name"],
             properties=data.get("properties", {})
         )
+    
+    def __reduce__(self):
+        """Pickle with a plain properties dict, since mapping proxies can't be pickled."""
+        return (type(self), (self.id, self.type, self.name, *_pickled_properties(self.properties)))
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Edge:
     """
     Represents an edge (relationship) in the knowledge graph.
@@ -63,7 +87,7 @@ class Edge:
     type: str
     source: str
     target: str
-    properties: dict[str, Any] = field(default_factory=dict)
+    properties: Mapping[str, Any] = field(default_factory=lambda: EMPTY_PROPERTIES)
     
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary format."""
@@ -72,7 +96,7 @@ class Edge:
             "type": self.type,
             "source": self.source,
             "target": self.target,
-            "properties": self.properties
+            "properties": dict(self.properties)
         }
     
     @classmethod
@@ -85,6 +109,39 @@ class Edge:
             target=data["target"],
             properties=data.get("properties", {})
         )
+    
+    def __reduce__(self):
+        """Pickle with a plain properties dict, since mapping proxies can't be pickled."""
+        return (type(self), (self.id, self.type, self.source, self.target, *_pickled_properties(self.properties)))
+
+
+@dataclass(slots=True)
+class NodeBatch:
+    """
+    Columnar (one list per field) form of a group of nodes.
+    
+    Bulk writes send these lists as query parameters instead of one dict per
+    node, so field names aren't repeated for every row.
+    """
+    ids: list[str]
+    types: list[str]
+    names: list[str]
+    props: list[Mapping[str, Any]]
+    
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Node]) -> "NodeBatch":
+        """Unzip nodes into columns in a single pass."""
+        batch = cls([], [], [], [])
+        for node in nodes:
+            batch.ids.append(node.id)
+            batch.types.append(node.type)
+            batch.names.append(node.name)
+            batch.props.append(node.properties)
+        return batch
+    
+    def __len__(self) -> int:
+        """Number of nodes in the batch."""
+        return len(self.ids)
 
 
 @dataclass
@@ -114,15 +171,23 @@ class BaseConnector(ABC):
     To add a new connector:
     1. Create a new file in connectors/ (e.g., terraform.py)
     2. Implement a class that inherits from BaseConnector
-    3. Implement the parse() method
-    4. Register with ConnectorRegistry
+    3. Set the connector_name class attribute (this registers the connector)
+    4. Implement the parse() method
     """
     
+    # Registry key; subclasses that set it are registered when they're defined
+    connector_name: ClassVar[str] = ""
+    
+    def __init_subclass__(cls, **kwargs):
+        """Register concrete connectors with ConnectorRegistry."""
+        super().__init_subclass__(**kwargs)
+        if cls.connector_name:
+            ConnectorRegistry._connectors[cls.connector_name] = cls
+    
     @property
-    @abstractmethod
     def name(self) -> str:
         """Return the connector name."""
-        pass
+        return self.connector_name
     
     @abstractmethod
     def parse(self, file_path: Path) -> ConnectorResult:
@@ -141,6 +206,30 @@ class BaseConnector(ABC):
         """
         pass
     
+    @classmethod
+    def parse_many(cls, file_paths: Iterable[Path], max_workers: Optional[int] = None) -> list[ConnectorResult]:
+        """
+        Parse several files in parallel worker processes.
+        
+        YAML parsing is CPU-bound, so processes (not threads) are used to get
+        past the GIL. A single file is parsed in-process.
+        
+        Args:
+            file_paths: Paths to the configuration files
+            max_workers: Worker process count (defaults to the CPU count)
+            
+        Returns:
+            One ConnectorResult per file, in input order
+        """
+        file_paths = list(file_paths)
+        if len(file_paths) <= 1:
+            return [cls().parse(file_path) for file_path in file_paths]
+        
+        workers = min(max_workers or os.cpu_count() or 1, len(file_paths))
+        chunksize = max(1, len(file_paths) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_parse_one, repeat(cls), file_paths, chunksize=chunksize))
+    
     def validate_file(self, file_path: Path) -> bool:
         """
         Validate that a file exists and is readable.
@@ -154,6 +243,11 @@ class BaseConnector(ABC):
         return file_path.exists() and file_path.is_file()
 
 
+def _parse_one(connector_cls: type[BaseConnector], file_path: Path) -> ConnectorResult:
+    """Parse one file in a worker process (module-level so it can be pickled)."""
+    return connector_cls().parse(file_path)
+
+
 class ConnectorRegistry:
     """
     Registry for managing available connectors.
@@ -167,26 +261,15 @@ class ConnectorRegistry:
     @classmethod
     def register(cls, connector_class: type[BaseConnector]) -> type[BaseConnector]:
         """
-        Register a connector class.
+        Register a connector class explicitly.
         
-        Can be used as a decorator:
+        Subclasses setting `connector_name` are registered automatically; this
+        covers classes without one (keyed by class name). Can be used as a decorator:
             @ConnectorRegistry.register
             class MyConnector(BaseConnector):
                 ...
         """
-        # Create a temporary instance to get the name
-        instance = connector_class.__new__(connector_class)
-        # Handle case where name is a property
-        if hasattr(connector_class, 'name'):
-            # Try to get name without initialization
-            try:
-                name = connector_class.name.fget(instance) if isinstance(connector_class.name, property) else instance.name
-            except:
-                # Fallback to class name
-                name = connector_class.__name__.lower().replace('connector', '')
-        else:
-            name = connector_class.__name__.lower()
-        
+        name = connector_class.connector_name or connector_class.__name__.lower().replace('connector', '')
         cls._connectors[name] = connector_class
         return connector_class
     
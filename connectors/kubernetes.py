@@ -10,10 +10,13 @@ import yaml
 from pathlib import Path
 from typing import Any
 
-from .base import BaseConnector, ConnectorResult, Node, Edge, ConnectorRegistry
+from .base import BaseConnector, ConnectorResult, Node, Edge, YamlLoader
+
+
+# Service name in a K8s service URL, with an optional namespace.svc.cluster.local suffix
+_K8S_SVC_RE = re.compile(r'//([a-zA-Z0-9_-]+)(?:\.[\w.-]+)?:')
 
 
-@ConnectorRegistry.register
 class KubernetesConnector(BaseConnector):
     """
     Connector for parsing Kubernetes manifest files.
@@ -27,23 +30,16 @@ class KubernetesConnector(BaseConnector):
     adding K8s-specific metadata to existing nodes.
     """
     
-    @property
-    def name(self) -> str:
-        return "kubernetes"
+    connector_name = "kubernetes"
     
     def parse(self, file_path: Path) -> ConnectorResult:
         """Parse k8s-deployments.yaml and extract nodes and edges."""
         if not self.validate_file(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
+        # Split YAML documents (separated by ---), parsing straight from the file
         with open(file_path, 'r') as f:
-            content = f.read()
-        
-        # Split YAML documents (separated by ---)
-        documents = []
-        for doc in yaml.safe_load_all(content):
-            if doc:
-                documents.append(doc)
+            documents = [doc for doc in yaml.load_all(f, Loader=YamlLoader) if doc]
         
         if not documents:
             raise ValueError(f"No valid Kubernetes resources found in {file_path}")
@@ -55,12 +51,16 @@ class KubernetesConnector(BaseConnector):
         deployments = []
         services = []
         
+        groups = {'Deployment': deployments, 'Service': services}
+        
         for doc in documents:
-            kind = doc.get('kind', '').lower()
-            if kind == 'deployment':
-                deployments.append(doc)
-            elif kind == 'service':
-                services.append(doc)
+            kind = doc.get('kind')
+            group = groups.get(kind)
+            # Kinds are canonically cased; only hand-written variants need normalizing
+            if group is None and isinstance(kind, str):
+                group = groups.get(kind.capitalize())
+            if group is not None:
+                group.append(doc)
         
         # Process deployments
         for deployment in deployments:
@@ -165,37 +165,30 @@ class KubernetesConnector(BaseConnector):
         """Extract relationship edges from container environment variables."""
         edges = []
         
-        spec = deployment.get('spec', {})
-        template = spec.get('template', {})
-        pod_spec = template.get('spec', {})
-        containers = pod_spec.get('containers', [])
-        
-        if not containers:
-            return edges
-        
-        container = containers[0]
-        env_vars = container.get('env', [])
+        containers = deployment.get('spec', {}).get('template', {}).get('spec', {}).get('containers', [])
+        env_vars = (containers[0] if containers else {}).get('env') or ()
         
         for env_var in env_vars:
-            name = env_var.get('name', '')
-            value = env_var.get('value', '')
+            # Cheapest checks first: only plain (non-secret) service URLs make edges
+            name = env_var.get('name')
+            if not name or not name.endswith('_URL') or name == 'DATABASE_URL' or 'valueFrom' in env_var:
+                continue
             
-            # Skip if value comes from secret
-            if env_var.get('valueFrom'):
+            value = env_var.get('value')
+            if not value or not isinstance(value, str):
                 continue
             
             # Handle service URLs
-            if name.endswith('_URL') and name != 'DATABASE_URL' and value:
-                target_service = self._extract_service_from_k8s_url(value)
-                if target_service and target_service != service_name:
-                    edge = Edge(
-                        id=f"edge:{service_name}-calls-{target_service}",
-                        type="calls",
-                        source=node_id,
-                        target=f"service:{target_service}",
-                        properties={"via": name, "source": "k8s"}
-                    )
-                    edges.append(edge)
+            target_service = self._extract_service_from_k8s_url(value)
+            if target_service and target_service != service_name:
+                edge = Edge(
+                    id=f"edge:{service_name}-calls-{target_service}",
+                    type="calls",
+                    source=node_id,
+                    target=f"service:{target_service}",
+                    properties={"via": name, "source": "k8s"}
+                )
+                edges.append(edge)
         
         return edges
     
@@ -207,11 +200,5 @@ class KubernetesConnector(BaseConnector):
         - http://payment-service.ecommerce.svc.cluster.local:8083
         - http://payment-service:8083
         """
-        try:
-            # Pattern for K8s DNS: service-name.namespace.svc.cluster.local
-            match = re.search(r'//([a-zA-Z0-9_-]+)(?:\.[\w.-]+)?:', url)
-            if match:
-                return match.group(1)
-        except Exception:
-            pass
-        return None
+        match = _K8S_SVC_RE.search(url)
+        return match.group(1) if match else None
@@ -5,14 +5,31 @@ Extracts team entities and their ownership relationships to services,
 databases, and other infrastructure components.
 """
 
+import re
 import yaml
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
-from .base import BaseConnector, ConnectorResult, Node, Edge, ConnectorRegistry
+from .base import BaseConnector, ConnectorResult, Node, Edge, EMPTY_PROPERTIES, YamlLoader
+
+
+_CACHE_NAME_RE = re.compile(r'redis|cache|memcached')
+
+
+@lru_cache(maxsize=4096)
+def _guess_type(name: str) -> str:
+    """Guess an owned item's type from its name; teams often list the same names."""
+    name_lower = name.lower()
+    
+    if name_lower.endswith('-db') or 'database' in name_lower:
+        return 'database'
+    if _CACHE_NAME_RE.search(name_lower):
+        return 'cache'
+    
+    return 'service'
 
 
-@ConnectorRegistry.register
 class TeamsConnector(BaseConnector):
     """
     Connector for parsing team configuration files.
@@ -22,9 +39,7 @@ class TeamsConnector(BaseConnector):
     - Ownership relationships between teams and services/databases
     """
     
-    @property
-    def name(self) -> str:
-        return "teams"
+    connector_name = "teams"
     
     def parse(self, file_path: Path) -> ConnectorResult:
         """Parse teams.yaml and extract team nodes and ownership edges."""
@@ -33,7 +48,7 @@ class TeamsConnector(BaseConnector):
         
         with open(file_path, 'r') as f:
             try:
-                data = yaml.safe_load(f)
+                data = yaml.load(f, Loader=YamlLoader)
             except yaml.YAMLError as e:
                 raise ValueError(f"Invalid YAML in {file_path}: {e}")
         
@@ -64,22 +79,18 @@ class TeamsConnector(BaseConnector):
             )
             nodes.append(node)
             
-            # Create ownership edges
-            owns = team.get('owns', [])
-            for owned_item in owns:
-                # We need to guess the type of the owned item
-                # This will be resolved when merging with docker-compose data
-                target_type = self._guess_type(owned_item)
-                target_id = f"{target_type}:{owned_item}"
-                
-                edge = Edge(
+            # Create ownership edges. The owned item's type is guessed here and
+            # resolved when merging with docker-compose data
+            edges.extend(
+                Edge(
                     id=f"edge:{team_name}-owns-{owned_item}",
                     type="owns",
                     source=node_id,
-                    target=target_id,
-                    properties={}
+                    target=f"{self._guess_type(owned_item)}:{owned_item}",
+                    properties=EMPTY_PROPERTIES
                 )
-                edges.append(edge)
+                for owned_item in team.get('owns', [])
+            )
         
         return ConnectorResult(
             nodes=nodes,
@@ -112,11 +123,4 @@ class TeamsConnector(BaseConnector):
         This is a heuristic - the actual type will be confirmed when
         merging with data from other connectors.
         """
-        name_lower = name.lower()
-        
-        if name_lower.endswith('-db') or 'database' in name_lower:
-            return 'database'
-        if 'redis' in name_lower or 'cache' in name_lower or 'memcached' in name_lower:
-            return 'cache'
-        
-        return 'service'
+        return _guess_type(name)
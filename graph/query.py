@@ -5,8 +5,34 @@ This module provides graph traversal and query functions for answering
 questions about infrastructure dependencies, ownership, and blast radius.
 """
 
-from typing import Any, Optional
-from graph.storage import GraphStorage
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Iterable, Optional
+
+from cachetools import TTLCache
+
+from graph.storage import Adjacency, GraphStorage
+
+
+# Per-node read results are reused for up to QUERY_CACHE_TTL seconds
+QUERY_CACHE_SIZE = 10_000
+QUERY_CACHE_TTL = 60
+
+# Maximum number of results returned by search_nodes
+SEARCH_LIMIT = 20
+
+# Relationship types through which a service uses a resource
+USING_RELATIONSHIPS = frozenset({"USES", "DEPENDS_ON", "CALLS"})
+
+
+def _search_text(node: dict[str, Any]) -> str:
+    """Lowercased name and ID of a node, as matched by search_nodes."""
+    return f"{node.get('name') or ''}\n{node['id']}".lower()
+
+
+def _trigrams(text: str) -> set[str]:
+    """All 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
 
 
 class QueryEngine:
@@ -30,6 +56,52 @@ class QueryEngine:
             storage: GraphStorage instance for database access
         """
         self.storage = storage
+        
+        # (method name, node ID) -> result; dropped when the storage writes those nodes
+        # Queries run on worker threads, so cache access is locked
+        self._cache: TTLCache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        storage.add_write_listener(self.invalidate)
+        
+        # (adjacency snapshot, trigram -> node IDs) for search_nodes
+        self._search_index: Optional[tuple[Adjacency, dict[str, set[str]]]] = None
+    
+    def scope(self):
+        """
+        Context manager running the block's queries on one shared session.
+        
+        Sessions are per thread, so concurrent requests each get their own.
+        """
+        return self.storage.scope()
+    
+    def invalidate(self, node_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        Drop cached reads after a graph write.
+        
+        Args:
+            node_ids: IDs of the written nodes, or None to drop everything
+        """
+        with self._cache_lock:
+            if node_ids is None:
+                self._cache.clear()
+                return
+            
+            node_ids = set(node_ids)
+            for key in [key for key in self._cache.keys() if key[1] in node_ids]:
+                self._cache.pop(key, None)
+    
+    def _cached(self, method: str, node_id: str, compute: Callable[[], Any]) -> Any:
+        """Return a cached per-node result, computing and storing it on a miss."""
+        key = (method, node_id)
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key]
+        
+        # Computed outside the lock; concurrent misses just run the query twice
+        value = compute()
+        with self._cache_lock:
+            self._cache[key] = value
+        return value
     
     def get_node(self, node_id: str) -> Optional[dict[str, Any]]:
         """
@@ -41,7 +113,7 @@ class QueryEngine:
         Returns:
             Node data as dictionary, or None if not found
         """
-        return self.storage.get_node(node_id)
+        return self._cached("get_node", node_id, lambda: self.storage.get_node(node_id))
     
     def get_nodes(
         self,
@@ -79,22 +151,8 @@ class QueryEngine:
         Returns:
             List of downstream nodes (dependencies)
         """
-        # Build relationship filter
-        if edge_types:
-            rel_filter = "|".join([t.upper().replace("-", "_") for t in edge_types])
-            rel_pattern = f"[r:{rel_filter}*1..{max_depth}]"
-        else:
-            rel_pattern = f"[r*1..{max_depth}]"
-        
-        query = f"""
-        MATCH (start {{id: $node_id}})
-        MATCH (start)-{rel_pattern}->(downstream)
-        RETURN DISTINCT downstream
-        """
-        
-        with self.storage.session() as session:
-            result = session.run(query, node_id=node_id)
-            return [dict(record["downstream"]) for record in result]
+        adjacency = self.storage.load_adjacency()
+        return self._traverse(adjacency.forward, adjacency.nodes, node_id, edge_types, max_depth)
     
     def upstream(
         self,
@@ -115,22 +173,53 @@ class QueryEngine:
         Returns:
             List of upstream nodes (dependents)
         """
-        # Build relationship filter
-        if edge_types:
-            rel_filter = "|".join([t.upper().replace("-", "_") for t in edge_types])
-            rel_pattern = f"[r:{rel_filter}*1..{max_depth}]"
-        else:
-            rel_pattern = f"[r*1..{max_depth}]"
-        
-        query = f"""
-        MATCH (target {{id: $node_id}})
-        MATCH (upstream)-{rel_pattern}->(target)
-        RETURN DISTINCT upstream
+        adjacency = self.storage.load_adjacency()
+        return self._traverse(adjacency.reverse, adjacency.nodes, node_id, edge_types, max_depth)
+    
+    def _traverse(
+        self,
+        edges: dict[str, list[tuple[str, dict[str, Any]]]],
+        nodes: dict[str, dict[str, Any]],
+        node_id: str,
+        edge_types: Optional[list[str]],
+        max_depth: int
+    ) -> list[dict[str, Any]]:
         """
+        Breadth-first search over one direction of the adjacency snapshot.
         
-        with self.storage.session() as session:
-            result = session.run(query, node_id=node_id)
-            return [dict(record["upstream"]) for record in result]
+        Returns every node within max_depth hops, in BFS order. Like the
+        equivalent Cypher pattern, the start node is included only when a
+        cycle leads back to it.
+        """
+        types = self._relationship_types(edge_types)
+        types = set(types) if types else None
+        
+        seen: set[str] = set()
+        found: list[dict[str, Any]] = []
+        frontier = deque([node_id])
+        
+        for _ in range(max_depth):
+            next_frontier = deque()
+            while frontier:
+                current = frontier.popleft()
+                for neighbor, rel in edges.get(current, ()):
+                    if neighbor in seen or (types is not None and rel["type"] not in types):
+                        continue
+                    seen.add(neighbor)
+                    next_frontier.append(neighbor)
+                    if neighbor in nodes:
+                        found.append(nodes[neighbor])
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        
+        return found
+    
+    def _relationship_types(self, edge_types: Optional[list[str]]) -> Optional[list[str]]:
+        """Relationship type names for an edge type filter, or None for all types."""
+        if not edge_types:
+            return None
+        return [t.upper().replace("-", "_") for t in edge_types]
     
     def blast_radius(self, node_id: str) -> dict[str, Any]:
         """
@@ -147,34 +236,40 @@ class QueryEngine:
         Returns:
             Dictionary with upstream, downstream, and affected_teams
         """
-        # Get the node itself
-        node = self.get_node(node_id)
-        
-        # Get upstream (what would break)
-        upstream = self.upstream(node_id)
-        
-        # Get downstream (dependencies)
-        downstream = self.downstream(node_id)
+        # One round trip for the node, both traversals and the owning teams
+        # (via OWNS and the 'team' property) of the node and everything upstream
+        query = """
+        MATCH (n {id: $node_id})
+        OPTIONAL MATCH (n)-[*1..10]->(d)
+        WITH n, collect(DISTINCT d) AS downstream
+        OPTIONAL MATCH (u)-[*1..10]->(n)
+        WITH n, downstream, collect(DISTINCT u) AS upstream
+        UNWIND [n] + upstream AS affected
+        OPTIONAL MATCH (team:Team)-[:OWNS]->(affected)
+        UNWIND [team.name, affected.team] AS team_name
+        RETURN n, upstream, downstream, collect(DISTINCT team_name) AS teams
+        """
         
-        # Get affected teams - teams that own any upstream service
-        affected_teams = set()
-        affected_node_ids = [node_id] + [n.get("id", "") for n in upstream]
+        rows = self.storage.execute_read(lambda tx: tx.run(query, node_id=node_id).data())
         
-        for affected_id in affected_node_ids:
-            owner = self.get_owner(affected_id)
-            if owner:
-                affected_teams.add(owner.get("name", ""))
+        if not rows:
+            return {
+                "node": None,
+                "upstream": [],
+                "downstream": [],
+                "affected_teams": [],
+                "total_impact": 0
+            }
         
-        # Also check team property on nodes
-        for n in upstream + [node] if node else upstream:
-            if n and n.get("team"):
-                affected_teams.add(n["team"])
+        record = rows[0]
+        upstream = record["upstream"]
+        downstream = record["downstream"]
         
         return {
-            "node": node,
+            "node": record["n"],
             "upstream": upstream,
             "downstream": downstream,
-            "affected_teams": list(affected_teams),
+            "affected_teams": record["teams"],
             "total_impact": len(upstream) + len(downstream)
         }
     
@@ -197,30 +292,119 @@ class QueryEngine:
         Returns:
             List of nodes in the path (including endpoints)
         """
+        # Searched in memory when traversals have loaded the graph; otherwise by Neo4j
+        adjacency = self.storage.adjacency
+        if adjacency is not None:
+            found = self._bidirectional_path(adjacency, from_id, to_id, max_depth)
+            if found is None:
+                return {"nodes": [], "relationships": [], "length": 0}
+            
+            path_ids, path_rels = found
+            return {
+                "nodes": [adjacency.nodes[path_id] for path_id in path_ids],
+                "relationships": path_rels,
+                "length": len(path_ids) - 1
+            }
+        
         query = f"""
         MATCH (start {{id: $from_id}}), (end {{id: $to_id}})
         MATCH path = shortestPath((start)-[*1..{max_depth}]->(end))
         RETURN nodes(path) as path_nodes, relationships(path) as path_rels
         """
         
-        with self.storage.session() as session:
-            result = session.run(query, from_id=from_id, to_id=to_id)
-            record = result.single()
+        record = self.storage.execute_read(
+            lambda tx: tx.run(query, from_id=from_id, to_id=to_id).single()
+        )
+        
+        if record:
+            path_nodes = [dict(n) for n in record["path_nodes"]]
+            path_rels = []
+            for r in record["path_rels"]:
+                rel_data = dict(r)
+                rel_data["type"] = r.type
+                path_rels.append(rel_data)
+            
+            return {
+                "nodes": path_nodes,
+                "relationships": path_rels,
+                "length": len(path_nodes) - 1
+            }
+        return {"nodes": [], "relationships": [], "length": 0}
+    
+    def _bidirectional_path(
+        self,
+        adjacency: Adjacency,
+        from_id: str,
+        to_id: str,
+        max_depth: int
+    ) -> Optional[tuple[list[str], list[dict[str, Any]]]]:
+        """
+        Shortest directed path by BFS from both ends until the frontiers meet.
+        
+        Each step expands the smaller frontier by one whole level, so the first
+        meeting point lies on a shortest path.
+        
+        Returns:
+            Node IDs and relationships along the path, or None if there is no
+            path within max_depth hops
+        """
+        if from_id == to_id or from_id not in adjacency.nodes or to_id not in adjacency.nodes:
+            return None
+        
+        # Node -> (neighbor towards the respective end, relationship), per side
+        forward_parents: dict[str, Optional[tuple[str, dict]]] = {from_id: None}
+        reverse_parents: dict[str, Optional[tuple[str, dict]]] = {to_id: None}
+        forward_frontier, reverse_frontier = deque([from_id]), deque([to_id])
+        
+        meeting = None
+        for _ in range(max_depth):
+            if not forward_frontier or not reverse_frontier:
+                break
+            
+            if len(forward_frontier) <= len(reverse_frontier):
+                frontier, edges = forward_frontier, adjacency.forward
+                parents, other_parents = forward_parents, reverse_parents
+            else:
+                frontier, edges = reverse_frontier, adjacency.reverse
+                parents, other_parents = reverse_parents, forward_parents
             
-            if record:
-                path_nodes = [dict(n) for n in record["path_nodes"]]
-                path_rels = []
-                for r in record["path_rels"]:
-                    rel_data = dict(r)
-                    rel_data["type"] = r.type
-                    path_rels.append(rel_data)
-                
-                return {
-                    "nodes": path_nodes,
-                    "relationships": path_rels,
-                    "length": len(path_nodes) - 1
-                }
-            return {"nodes": [], "relationships": [], "length": 0}
+            for _ in range(len(frontier)):
+                current = frontier.popleft()
+                for neighbor, rel in edges.get(current, ()):
+                    if neighbor in parents:
+                        continue
+                    parents[neighbor] = (current, rel)
+                    frontier.append(neighbor)
+                    if neighbor in other_parents:
+                        meeting = neighbor
+                        break
+                if meeting:
+                    break
+            if meeting:
+                break
+        
+        if meeting is None:
+            return None
+        
+        # Walk back to from_id, then forward to to_id
+        path_ids, path_rels = [meeting], []
+        step = forward_parents[meeting]
+        while step:
+            previous, rel = step
+            path_ids.append(previous)
+            path_rels.append(rel)
+            step = forward_parents[previous]
+        path_ids.reverse()
+        path_rels.reverse()
+        
+        step = reverse_parents[meeting]
+        while step:
+            following, rel = step
+            path_ids.append(following)
+            path_rels.append(rel)
+            step = reverse_parents[following]
+        
+        return path_ids, path_rels
     
     def get_owner(self, node_id: str) -> Optional[dict[str, Any]]:
         """
@@ -234,26 +418,27 @@ class QueryEngine:
         Returns:
             Team node data, or None if no owner found
         """
+        return self._cached("get_owner", node_id, lambda: self._fetch_owner(node_id))
+    
+    def _fetch_owner(self, node_id: str) -> Optional[dict[str, Any]]:
+        """Query the owning team of a node (uncached)."""
         query = """
         MATCH (team:Team)-[:OWNS]->(target {id: $node_id})
         RETURN team
         """
         
-        with self.storage.session() as session:
-            result = session.run(query, node_id=node_id)
-            record = result.single()
-            
-            if record:
-                return dict(record["team"])
-            
-            # Fallback: check the 'team' property on the node itself
-            node = self.get_node(node_id)
-            if node and node.get("team"):
-                team_name = node["team"]
-                team = self.get_node(f"team:{team_name}")
-                return team
-            
-            return None
+        record = self.storage.execute_read(lambda tx: tx.run(query, node_id=node_id).single())
+        if record:
+            return dict(record["team"])
+        
+        # Fallback: check the 'team' property on the node itself
+        node = self.get_node(node_id)
+        if node and node.get("team"):
+            team_name = node["team"]
+            team = self.get_node(f"team:{team_name}")
+            return team
+        
+        return None
     
     def get_team_assets(self, team_id: str) -> list[dict[str, Any]]:
         """
@@ -272,9 +457,9 @@ class QueryEngine:
         RETURN asset
         """
         
-        with self.storage.session() as session:
-            result = session.run(query, team_id=team_id)
-            return [dict(record["asset"]) for record in result]
+        return self.storage.execute_read(
+            lambda tx: [row["asset"] for row in tx.run(query, team_id=team_id).data("asset")]
+        )
     
     def get_services_using(self, node_id: str) -> list[dict[str, Any]]:
         """
@@ -288,14 +473,13 @@ class QueryEngine:
         Returns:
             List of services using the resource
         """
-        query = """
-        MATCH (service)-[:USES|DEPENDS_ON|CALLS]->(target {id: $node_id})
-        RETURN DISTINCT service
-        """
-        
-        with self.storage.session() as session:
-            result = session.run(query, node_id=node_id)
-            return [dict(record["service"]) for record in result]
+        adjacency = self.storage.load_adjacency()
+        services = {
+            source: adjacency.nodes[source]
+            for source, rel in adjacency.reverse.get(node_id, ())
+            if rel["type"] in USING_RELATIONSHIPS and source in adjacency.nodes
+        }
+        return list(services.values())
     
     def get_oncall(self, node_id: str) -> Optional[str]:
         """
@@ -309,6 +493,10 @@ class QueryEngine:
         Returns:
             Oncall identifier (e.g., "@dave"), or None
         """
+        return self._cached("get_oncall", node_id, lambda: self._fetch_oncall(node_id))
+    
+    def _fetch_oncall(self, node_id: str) -> Optional[str]:
+        """Resolve the oncall for a node from its properties or owner (uncached)."""
         # First check the node's oncall property
         node = self.get_node(node_id)
         if node and node.get("oncall"):
@@ -325,23 +513,51 @@ class QueryEngine:
         """
         Search for nodes by name or property values.
         
+        Matches are case-insensitive substrings of the node name or ID, looked
+        up in a trigram index over the adjacency snapshot.
+        
         Args:
             query_text: Text to search for
             
         Returns:
             List of matching nodes
         """
-        query = """
-        MATCH (n)
-        WHERE toLower(n.name) CONTAINS toLower($query)
-           OR toLower(n.id) CONTAINS toLower($query)
-        RETURN n
-        LIMIT 20
-        """
-        
-        with self.storage.session() as session:
-            result = session.run(query, query=query_text)
-            return [dict(record["n"]) for record in result]
+        adjacency = self.storage.load_adjacency()
+        needle = query_text.lower()
+        
+        # Every trigram of the query occurs in a match; shorter queries scan all nodes
+        trigrams = _trigrams(needle)
+        if trigrams:
+            index = self._load_search_index(adjacency)
+            postings = sorted((index.get(trigram, set()) for trigram in trigrams), key=len)
+            candidates = sorted(set.intersection(*postings))
+        else:
+            candidates = adjacency.nodes
+        
+        matches = []
+        for candidate in candidates:
+            node = adjacency.nodes[candidate]
+            if needle in _search_text(node):
+                matches.append(node)
+                if len(matches) == SEARCH_LIMIT:
+                    break
+        return matches
+    
+    def _load_search_index(self, adjacency: Adjacency) -> dict[str, set[str]]:
+        """Return the trigram -> node IDs index for an adjacency snapshot, building it if needed."""
+        with self._cache_lock:
+            if self._search_index is not None and self._search_index[0] is adjacency:
+                return self._search_index[1]
+        
+        index: dict[str, set[str]] = defaultdict(set)
+        for node_id, node in adjacency.nodes.items():
+            for trigram in _trigrams(_search_text(node)):
+                index[trigram].add(node_id)
+        
+        # The snapshot is replaced after every write, which rebuilds the index
+        with self._cache_lock:
+            self._search_index = (adjacency, index)
+        return index
     
     def get_graph_stats(self) -> dict[str, int]:
         """Get statistics about the graph."""
@@ -5,13 +5,35 @@ This module handles the transformation of Property Graph data (Nodes/Edges)
 into Semantic Web standards (RDF/Turtle) using a custom Ontology.
 """
 
+from functools import lru_cache
+from itertools import chain, islice
 from rdflib import Graph, Literal, RDF, RDFS, Namespace, URIRef
 from rdflib.namespace import FOAF, XSD
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 from graph.storage import GraphStorage
 
 
+# Triples are inserted into the store in batches of this size
+RDF_BATCH_SIZE = 10_000
+
+Triple = tuple[Any, Any, Any]
+
+
+@lru_cache(maxsize=4096)
+def _clean_id(node_id: str) -> str:
+    """Node ID without its type prefix, for use in URIs."""
+    if ":" in node_id:
+        return node_id.split(":", 1)[1]
+    return node_id
+
+
+@lru_cache(maxsize=4096)
+def _string_literal(value: str) -> Literal:
+    """xsd:string literal; names and property values repeat across nodes."""
+    return Literal(value, datatype=XSD.string)
+
+
 class RDFExporter:
     """
     Exports the Engineering Knowledge Graph to RDF format.
@@ -19,39 +41,22 @@ class RDFExporter:
     
     def __init__(self, storage: GraphStorage):
         self.storage = storage
-        self.g = Graph()
+        self.g = Graph(store="Memory")
         
         # Define Namespaces
         self.EKG = Namespace("http://mycompany.com/ekg#")
         self.g.bind("ekg", self.EKG)
         self.g.bind("foaf", FOAF)
         
-    def _clean_id(self, node_id: str) -> str:
-        """Clean node ID for URI usage (remove prefix)."""
-        if ":" in node_id:
-            return node_id.split(":", 1)[1]
-        return node_id
-
-    def _get_uri(self, node_id: str, node_type: str) -> URIRef:
-        """Generate URI for a node."""
-        clean_name = self._clean_id(node_id)
-        # Use PascalCase for Type (class) reference if needed, but here simple ID reference
-        return self.EKG[clean_name]
-
-    def _map_type_to_class(self, node_type: str) -> URIRef:
-        """Map internal node types to Ontology classes."""
-        mapping = {
+        # Ontology mappings, built once rather than per node or edge
+        self._type_classes = {
             "service": self.EKG.Service,
             "database": self.EKG.Database,
             "cache": self.EKG.Cache,
             "team": self.EKG.Team,
             "person": FOAF.Person
         }
-        return mapping.get(node_type, self.EKG.Resource)
-
-    def _map_edge_to_predicate(self, edge_type: str) -> URIRef:
-        """Map internal edge types to Ontology properties."""
-        mapping = {
+        self._edge_predicates = {
             "owns": self.EKG.owns,
             "depends_on": self.EKG.dependsOn,
             "calls": self.EKG.calls,
@@ -59,7 +64,31 @@ class RDFExporter:
             "writes_to": self.EKG.writesTo,
             "uses": self.EKG.uses
         }
-        return mapping.get(edge_type, self.EKG.relatedTo)
+        
+        # Node URIs and property predicates, reused across triples
+        self._uris: dict[str, URIRef] = {}
+        self._property_predicates: dict[str, URIRef] = {}
+        
+    def _clean_id(self, node_id: str) -> str:
+        """Clean node ID for URI usage (remove prefix)."""
+        return _clean_id(node_id)
+
+    def _get_uri(self, node_id: str, node_type: str) -> URIRef:
+        """Generate URI for a node."""
+        uri = self._uris.get(node_id)
+        if uri is None:
+            clean_name = self._clean_id(node_id)
+            # Use PascalCase for Type (class) reference if needed, but here simple ID reference
+            uri = self._uris[node_id] = self.EKG[clean_name]
+        return uri
+
+    def _map_type_to_class(self, node_type: str) -> URIRef:
+        """Map internal node types to Ontology classes."""
+        return self._type_classes.get(node_type, self.EKG.Resource)
+
+    def _map_edge_to_predicate(self, edge_type: str) -> URIRef:
+        """Map internal edge types to Ontology properties."""
+        return self._edge_predicates.get(edge_type, self.EKG.relatedTo)
 
     def generate_graph(self) -> Graph:
         """
@@ -68,20 +97,28 @@ class RDFExporter:
         Returns:
             rdflib.Graph populated with triples.
         """
-        # 1. Fetch all data
-        nodes = self.storage.get_all_nodes()
-        edges = self.storage.get_all_edges()
+        # 1. Stream data on one session, adding triples in batches as records arrive
+        with self.storage.scope():
+            triples = chain(
+                self._node_triples(self.storage.iter_all_nodes()),
+                self._edge_triples(self.storage.iter_all_edges())
+            )
+            while batch := list(islice(triples, RDF_BATCH_SIZE)):
+                self.g.addN((s, p, o, self.g) for s, p, o in batch)
         
-        # 2. Add Nodes as Subjects
+        return self.g
+
+    def _node_triples(self, nodes: Iterable[dict[str, Any]]) -> Iterator[Triple]:
+        """Triples for nodes as subjects with their class, label and properties."""
         for node in nodes:
             node_uri = self._get_uri(node["id"], node["type"])
             node_class = self._map_type_to_class(node["type"])
             
             # Type definition
-            self.g.add((node_uri, RDF.type, node_class))
+            yield node_uri, RDF.type, node_class
             
             # Label
-            self.g.add((node_uri, RDFS.label, Literal(node["name"], datatype=XSD.string)))
+            yield node_uri, RDFS.label, _string_literal(node["name"])
             
             # Properties (Metadata)
             if "properties" in node:
@@ -90,20 +127,20 @@ class RDFExporter:
                     
                     # Store properties as ekg:hasPropertyName
                     # Capitalize first letter for property name convention if desired
-                    prop_name = f"has{k.capitalize()}"
-                    predicate = self.EKG[prop_name]
+                    predicate = self._property_predicates.get(k)
+                    if predicate is None:
+                        predicate = self._property_predicates[k] = self.EKG[f"has{k.capitalize()}"]
                     
-                    self.g.add((node_uri, predicate, Literal(str(v), datatype=XSD.string)))
+                    yield node_uri, predicate, _string_literal(v if isinstance(v, str) else str(v))
 
-        # 3. Add Edges as Predicates
+    def _edge_triples(self, edges: Iterable[dict[str, Any]]) -> Iterator[Triple]:
+        """Triples for edges as predicates between node URIs."""
         for edge in edges:
             source_uri = self._get_uri(edge["source"], "") # Type unknown here without lookup, but ID is enough
             target_uri = self._get_uri(edge["target"], "")
             predicate = self._map_edge_to_predicate(edge["type"])
             
-            self.g.add((source_uri, predicate, target_uri))
-            
-        return self.g
+            yield source_uri, predicate, target_uri
 
     def export_turtle(self) -> str:
         """Generate Turtle string."""
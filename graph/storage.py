@@ -5,15 +5,135 @@ This module provides the persistence layer for the Engineering Knowledge Graph,
 supporting CRUD operations on nodes and edges stored in Neo4j.
 """
 
-import json
 import os
-from typing import Any, Optional
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, Mapping, Optional, TypeVar
 from contextlib import contextmanager
 
+import orjson
 from neo4j import GraphDatabase, Driver
 from neo4j.exceptions import ServiceUnavailable, AuthError
 
-from connectors.base import Node, Edge
+from connectors.base import Node, Edge, NodeBatch
+
+
+# Maximum number of rows sent in a single UNWIND statement
+BULK_BATCH_SIZE = 1000
+
+# Maximum number of nodes fetched per page when iterating over the whole graph
+PAGE_SIZE = 10_000
+
+# Sanitized labels and relationship types are interpolated into Cypher, so they
+# must be plain identifiers
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+T = TypeVar("T")
+
+
+def _run_and_consume(tx, query: str, **params: Any) -> None:
+    """Transaction function running a write query whose result isn't needed."""
+    tx.run(query, **params).consume()
+
+
+def _single(tx, query: str, **params: Any) -> Optional[Any]:
+    """Transaction function returning the only record of a query, if any."""
+    return tx.run(query, **params).single()
+
+
+@lru_cache(maxsize=1024)
+def _sanitize_label(label: str) -> str:
+    """PascalCase Neo4j label for a node type; bulk loads repeat the same few types."""
+    # Remove common prefixes and clean up
+    label = label.replace("-", "_").replace(" ", "_")
+    # Convert to PascalCase
+    parts = label.split("_")
+    return _validate_identifier("".join(part.capitalize() for part in parts))
+
+
+@lru_cache(maxsize=1024)
+def _sanitize_relationship(rel_type: str) -> str:
+    """UPPER_SNAKE_CASE Neo4j relationship type for an edge type."""
+    return _validate_identifier(rel_type.upper().replace("-", "_").replace(" ", "_"))
+
+
+def _validate_identifier(name: str) -> str:
+    """Return a sanitized label or relationship type, rejecting anything unsafe for Cypher."""
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid Neo4j label or relationship type: {name!r}")
+    return name
+
+
+def _quote_identifier(name: str) -> str:
+    """Backtick-quote a label or index name read back from the database for Cypher."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+@lru_cache(maxsize=1024)
+def _node_upsert_query(label: str, has_properties: bool) -> str:
+    """MERGE query for a single node, skipping the property SET when there are none."""
+    properties_clause = ",\n            n += $properties" if has_properties else ""
+    return f"""
+        MERGE (n:{label} {{id: $id}})
+        SET n.name = $name,
+            n.type = $type{properties_clause}
+        """
+
+
+@lru_cache(maxsize=1024)
+def _edge_upsert_query(rel_type: str, has_properties: bool) -> str:
+    """MERGE query for a single edge, skipping the property SET when there are none."""
+    properties_clause = "\n        SET r += $properties" if has_properties else ""
+    return f"""
+        MATCH (source {{id: $source}})
+        MATCH (target {{id: $target}})
+        MERGE (source)-[r:{rel_type} {{id: $id}}]->(target){properties_clause}
+        """
+
+
+@lru_cache(maxsize=1024)
+def _bulk_node_upsert_query(label: str) -> str:
+    """UNWIND MERGE query for a columnar batch of nodes with one label."""
+    return f"""
+        UNWIND range(0, size($ids) - 1) AS i
+        MERGE (n:{label} {{id: $ids[i]}})
+        SET n.name = $names[i],
+            n.type = $types[i],
+            n += $props[i]
+        """
+
+
+@lru_cache(maxsize=1024)
+def _bulk_edge_upsert_query(rel_type: str, has_properties: bool) -> str:
+    """UNWIND MERGE query for a batch of edge rows with one relationship type."""
+    properties_clause = "\n        SET r += row.properties" if has_properties else ""
+    return f"""
+        UNWIND $rows AS row
+        MATCH (source {{id: row.source}})
+        MATCH (target {{id: row.target}})
+        MERGE (source)-[r:{rel_type} {{id: row.id}}]->(target){properties_clause}
+        """
+
+
+@dataclass(slots=True)
+class Adjacency:
+    """
+    In-memory snapshot of the graph for client-side traversals.
+    
+    Attributes:
+        nodes: Node data by ID
+        forward: Node ID -> (target ID, relationship) for outgoing edges
+        reverse: Node ID -> (source ID, relationship) for incoming edges
+    
+    Relationships are dicts of their properties plus "type", shared by both
+    directions.
+    """
+    nodes: dict[str, dict[str, Any]]
+    forward: dict[str, list[tuple[str, dict[str, Any]]]]
+    reverse: dict[str, list[tuple[str, dict[str, Any]]]]
 
 
 class GraphStorage:
@@ -45,7 +165,25 @@ class GraphStorage:
         self.user = user or os.getenv("NEO4J_USER", "neo4j")
         self.password = password or os.getenv("NEO4J_PASSWORD", "")
         
+        # Connection pool sizing, shared by every session opened on the driver
+        self.max_pool_size = int(os.getenv("NEO4J_MAX_POOL_SIZE", 50))
+        self.max_connection_lifetime = int(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", 3600))
+        
         self._driver: Optional[Driver] = None
+        
+        # Called with the IDs of written nodes (None for graph-wide writes)
+        self._write_listeners: list[Callable[[Optional[Iterable[str]]], None]] = []
+        
+        # Holds the session of an active scope() on each thread
+        self._local = threading.local()
+        
+        # Adjacency snapshot, dropped on every write and reloaded on demand
+        self._adjacency: Optional[Adjacency] = None
+        self._adjacency_lock = threading.Lock()
+        
+        # Bumped on every write; a snapshot is only kept if no write happened while it loaded
+        self._write_generation = 0
+        self._generation_lock = threading.Lock()
     
     def connect(self) -> None:
         """Establish connection to Neo4j."""
@@ -53,7 +191,9 @@ class GraphStorage:
             # For Neo4j Aura (neo4j+s://), encryption is handled by the URI scheme
             self._driver = GraphDatabase.driver(
                 self.uri,
-                auth=(self.user, self.password)
+                auth=(self.user, self.password),
+                max_connection_pool_size=self.max_pool_size,
+                max_connection_lifetime=self.max_connection_lifetime
             )
             # Verify connectivity
             self._driver.verify_connectivity()
@@ -68,9 +208,37 @@ class GraphStorage:
             self._driver.close()
             self._driver = None
     
+    def add_write_listener(self, listener: Callable[[Optional[Iterable[str]]], None]) -> None:
+        """
+        Register a callback run after every write, e.g. to invalidate read caches.
+        
+        Args:
+            listener: Called with the IDs of the nodes touched by the write,
+                or None when the write may affect any node
+        """
+        self._write_listeners.append(listener)
+    
+    def _notify_write(self, node_ids: Optional[Iterable[str]] = None) -> None:
+        """Drop the adjacency snapshot and tell write listeners which nodes changed."""
+        with self._generation_lock:
+            self._write_generation += 1
+            self._adjacency = None
+        for listener in self._write_listeners:
+            listener(node_ids)
+    
     @contextmanager
     def session(self):
-        """Context manager for database sessions."""
+        """
+        Context manager for database sessions.
+        
+        Inside a scope() on the same thread the scope's session is reused;
+        otherwise a session is opened and closed around the block.
+        """
+        scoped = getattr(self._local, "session", None)
+        if scoped is not None:
+            yield scoped
+            return
+        
         if not self._driver:
             self.connect()
         session = self._driver.session()
@@ -79,6 +247,40 @@ class GraphStorage:
         finally:
             session.close()
     
+    def execute_read(self, work: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a read transaction function, retried on transient errors.
+        
+        Read transactions are routed to read replicas on clustered deployments.
+        The function gets the transaction plus *args/**kwargs and must consume
+        its results before returning.
+        """
+        with self.session() as session:
+            return session.execute_read(work, *args, **kwargs)
+    
+    def execute_write(self, work: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a write transaction function, retried on transient errors."""
+        with self.session() as session:
+            return session.execute_write(work, *args, **kwargs)
+    
+    @contextmanager
+    def scope(self):
+        """
+        Share one session among all queries run in the block on this thread.
+        
+        Scopes nest; only the outermost one opens and closes the session.
+        """
+        if getattr(self._local, "session", None) is not None:
+            yield
+            return
+        
+        with self.session() as session:
+            self._local.session = session
+            try:
+                yield
+            finally:
+                self._local.session = None
+    
     def upsert_node(self, node: Node) -> None:
         """
         Insert or update a node in the graph.
@@ -94,21 +296,15 @@ class GraphStorage:
         # Flatten properties (Neo4j doesn't support nested objects)
         flat_props = self._flatten_properties(node.properties)
         
-        query = f"""
-        MERGE (n:{label} {{id: $id}})
-        SET n.name = $name,
-            n.type = $type,
-            n += $properties
-        """
-        
-        with self.session() as session:
-            session.run(
-                query,
-                id=node.id,
-                name=node.name,
-                type=node.type,
-                properties=flat_props
-            )
+        self.execute_write(
+            _run_and_consume,
+            _node_upsert_query(label, bool(flat_props)),
+            id=node.id,
+            name=node.name,
+            type=node.type,
+            properties=flat_props
+        )
+        self._notify_write([node.id])
     
     def upsert_edge(self, edge: Edge) -> None:
         """
@@ -126,21 +322,83 @@ class GraphStorage:
         # Flatten properties
         flat_props = self._flatten_properties(edge.properties)
         
-        query = f"""
-        MATCH (source {{id: $source}})
-        MATCH (target {{id: $target}})
-        MERGE (source)-[r:{rel_type} {{id: $id}}]->(target)
-        SET r += $properties
+        self.execute_write(
+            _run_and_consume,
+            _edge_upsert_query(rel_type, bool(flat_props)),
+            id=edge.id,
+            source=edge.source,
+            target=edge.target,
+            properties=flat_props
+        )
+        # Ownership edges change what the target node resolves to
+        self._notify_write([edge.source, edge.target])
+    
+    def upsert_nodes_bulk(self, nodes: Iterable[Node], batch_size: int = BULK_BATCH_SIZE) -> None:
         """
+        Insert or update many nodes using batched UNWIND queries.
+        
+        Nodes are grouped by label so each group is written with a single
+        MERGE statement per batch instead of one round-trip per node. Each
+        group is sent as a columnar NodeBatch, indexed by position in Cypher.
+        
+        Args:
+            nodes: The nodes to upsert
+            batch_size: Maximum number of rows per UNWIND statement
+        """
+        nodes_by_label: dict[str, list[Node]] = defaultdict(list)
+        for node in nodes:
+            nodes_by_label[self._sanitize_label(node.type)].append(node)
         
         with self.session() as session:
-            session.run(
-                query,
-                id=edge.id,
-                source=edge.source,
-                target=edge.target,
-                properties=flat_props
-            )
+            for label, group in nodes_by_label.items():
+                batch = NodeBatch.from_nodes(group)
+                props = [self._flatten_properties(properties) for properties in batch.props]
+                query = _bulk_node_upsert_query(label)
+                for start in range(0, len(batch), batch_size):
+                    end = start + batch_size
+                    session.execute_write(
+                        _run_and_consume,
+                        query,
+                        ids=batch.ids[start:end],
+                        names=batch.names[start:end],
+                        types=batch.types[start:end],
+                        props=props[start:end]
+                    )
+        self._notify_write([node.id for group in nodes_by_label.values() for node in group])
+    
+    def upsert_edges_bulk(self, edges: Iterable[Edge], batch_size: int = BULK_BATCH_SIZE) -> None:
+        """
+        Insert or update many edges using batched UNWIND queries.
+        
+        Edges are grouped by relationship type so each group is written with a
+        single MERGE statement per batch; edges without properties get one that
+        skips the property SET. Nodes must exist before creating edges.
+        
+        Args:
+            edges: The edges to upsert
+            batch_size: Maximum number of rows per UNWIND statement
+        """
+        rows_by_type: dict[tuple[str, bool], list[dict[str, Any]]] = defaultdict(list)
+        for edge in edges:
+            properties = self._flatten_properties(edge.properties)
+            rows_by_type[self._sanitize_relationship(edge.type), bool(properties)].append({
+                "id": edge.id,
+                "source": edge.source,
+                "target": edge.target,
+                "properties": properties
+            })
+        
+        with self.session() as session:
+            for (rel_type, has_properties), rows in rows_by_type.items():
+                query = _bulk_edge_upsert_query(rel_type, has_properties)
+                for start in range(0, len(rows), batch_size):
+                    session.execute_write(_run_and_consume, query, rows=rows[start:start + batch_size])
+        self._notify_write({
+            node_id
+            for rows in rows_by_type.values()
+            for row in rows
+            for node_id in (row["source"], row["target"])
+        })
     
     def get_node(self, node_id: str) -> Optional[dict[str, Any]]:
         """
@@ -157,14 +415,10 @@ class GraphStorage:
         RETURN n
         """
         
-        with self.session() as session:
-            result = session.run(query, id=node_id)
-            record = result.single()
-            
-            if record:
-                node_data = dict(record["n"])
-                return node_data
-            return None
+        record = self.execute_read(_single, query, id=node_id)
+        if record:
+            return dict(record["n"])
+        return None
     
     def get_nodes(
         self,
@@ -198,9 +452,9 @@ class GraphStorage:
         
         query += " RETURN n"
         
-        with self.session() as session:
-            result = session.run(query, **filters)
-            return [dict(record["n"]) for record in result]
+        return self.execute_read(
+            lambda tx: [row["n"] for row in tx.run(query, **filters).data("n")]
+        )
     
     def delete_node(self, node_id: str) -> bool:
         """
@@ -218,10 +472,11 @@ class GraphStorage:
         RETURN count(n) as deleted
         """
         
-        with self.session() as session:
-            result = session.run(query, id=node_id)
-            record = result.single()
-            return record["deleted"] > 0 if record else False
+        record = self.execute_write(_single, query, id=node_id)
+        
+        # Deleting a team also changes the owners of its assets
+        self._notify_write()
+        return record["deleted"] > 0 if record else False
     
     def clear_graph(self) -> None:
         """Delete all nodes and edges from the graph."""
@@ -230,69 +485,161 @@ class GraphStorage:
         DETACH DELETE n
         """
         
-        with self.session() as session:
-            session.run(query)
+        self.execute_write(_run_and_consume, query)
+        self._notify_write()
     
     def get_all_nodes(self) -> list[dict[str, Any]]:
         """Retrieve all nodes in the graph."""
-        query = """
-        MATCH (n)
-        RETURN n
+        return list(self.iter_all_nodes())
+    
+    def iter_all_nodes(self, batch_size: int = PAGE_SIZE) -> Iterator[dict[str, Any]]:
         """
+        Yield all nodes in the graph, label by label, ordered by ID within each.
         
-        with self.session() as session:
-            result = session.run(query)
-            return [dict(record["n"]) for record in result]
+        Nodes are fetched in pages keyed on the last ID seen, so only one page
+        is held in memory at a time. Paging within a label lets each page be
+        served from that label's id index rather than a scan of the graph.
+        
+        Args:
+            batch_size: Maximum number of nodes per page
+        """
+        for label in self._labels():
+            query = f"""
+            MATCH (n:{_quote_identifier(label)})
+            WHERE n.id > $cursor
+            RETURN n
+            ORDER BY n.id
+            LIMIT $batch_size
+            """
+            
+            cursor = ""
+            while True:
+                page = self.execute_read(
+                    lambda tx: [row["n"] for row in tx.run(query, cursor=cursor, batch_size=batch_size).data("n")]
+                )
+                yield from page
+                if len(page) < batch_size:
+                    break
+                cursor = page[-1]["id"]
     
     def get_all_edges(self) -> list[dict[str, Any]]:
         """Retrieve all edges in the graph."""
-        query = """
-        MATCH (source)-[r]->(target)
-        RETURN r, source.id as source_id, target.id as target_id, type(r) as rel_type
+        return list(self.iter_all_edges())
+    
+    def iter_all_edges(self, batch_size: int = PAGE_SIZE) -> Iterator[dict[str, Any]]:
         """
+        Yield all edges in the graph, grouped by source node.
         
-        with self.session() as session:
-            result = session.run(query)
-            edges = []
-            for record in result:
-                edge_data = dict(record["r"])
-                edge_data["source"] = record["source_id"]
-                edge_data["target"] = record["target_id"]
-                edge_data["type"] = record["rel_type"]
-                edges.append(edge_data)
-            return edges
+        Edges are fetched in pages of up to batch_size source nodes of one
+        label, keyed on the last source ID seen, as in iter_all_nodes.
+        
+        Args:
+            batch_size: Maximum number of source nodes per page
+        """
+        for label in self._labels():
+            query = f"""
+            MATCH (source:{_quote_identifier(label)})
+            WHERE source.id > $cursor
+            WITH source
+            ORDER BY source.id
+            LIMIT $batch_size
+            OPTIONAL MATCH (source)-[r]->(target)
+            RETURN properties(r) as properties, source.id as source_id,
+                   target.id as target_id, type(r) as rel_type
+            """
+            
+            cursor = ""
+            while True:
+                rows = self.execute_read(
+                    lambda tx: tx.run(query, cursor=cursor, batch_size=batch_size).data()
+                )
+                if not rows:
+                    break
+                
+                # Source nodes without outgoing edges come back with r = null
+                for row in rows:
+                    if row["rel_type"] is not None:
+                        edge_data = row["properties"]
+                        edge_data["source"] = row["source_id"]
+                        edge_data["target"] = row["target_id"]
+                        edge_data["type"] = row["rel_type"]
+                        yield edge_data
+                cursor = max(row["source_id"] for row in rows)
+    
+    def _labels(self) -> list[str]:
+        """All node labels in the database."""
+        return self.execute_read(
+            lambda tx: [row["label"] for row in tx.run("CALL db.labels() YIELD label RETURN label").data()]
+        )
+    
+    @property
+    def adjacency(self) -> Optional[Adjacency]:
+        """The adjacency snapshot if one is loaded, without loading it."""
+        return self._adjacency
+    
+    def load_adjacency(self) -> Adjacency:
+        """
+        Return the adjacency snapshot, loading it from the database if needed.
+        
+        The snapshot is built from one pass over all nodes and edges and
+        reused until the next write through this storage. A snapshot that
+        overlapped a write is returned to its caller but not kept.
+        """
+        adjacency = self._adjacency
+        if adjacency is not None:
+            return adjacency
+        
+        with self._adjacency_lock:
+            adjacency = self._adjacency
+            if adjacency is None:
+                generation = self._write_generation
+                forward: dict[str, list[tuple[str, dict[str, Any]]]] = defaultdict(list)
+                reverse: dict[str, list[tuple[str, dict[str, Any]]]] = defaultdict(list)
+                with self.scope():
+                    nodes = {node["id"]: node for node in self.iter_all_nodes()}
+                    for edge in self.iter_all_edges():
+                        source, target = edge.pop("source"), edge.pop("target")
+                        forward[source].append((target, edge))
+                        reverse[target].append((source, edge))
+                adjacency = Adjacency(nodes, dict(forward), dict(reverse))
+                
+                with self._generation_lock:
+                    if self._write_generation == generation:
+                        self._adjacency = adjacency
+            return adjacency
     
     def get_node_count(self) -> int:
         """Get the total number of nodes."""
         query = "MATCH (n) RETURN count(n) as count"
         
-        with self.session() as session:
-            result = session.run(query)
-            record = result.single()
-            return record["count"] if record else 0
+        record = self.execute_read(_single, query)
+        return record["count"] if record else 0
     
     def get_edge_count(self) -> int:
         """Get the total number of edges."""
         query = "MATCH ()-[r]->() RETURN count(r) as count"
         
-        with self.session() as session:
-            result = session.run(query)
-            record = result.single()
-            return record["count"] if record else 0
+        record = self.execute_read(_single, query)
+        return record["count"] if record else 0
     
     def create_indexes(self) -> None:
-        """Create indexes for better query performance."""
+        """
+        Create indexes for better query performance.
+        
+        Every label gets its own index on id, which lookups and the paged
+        iter_all_nodes/iter_all_edges rely on.
+        """
+        labels = dict.fromkeys(["Service", "Database", "Cache", "Team", *self._labels()])
         indexes = [
-            "CREATE INDEX node_id IF NOT EXISTS FOR (n:Service) ON (n.id)",
-            "CREATE INDEX node_id IF NOT EXISTS FOR (n:Database) ON (n.id)",
-            "CREATE INDEX node_id IF NOT EXISTS FOR (n:Cache) ON (n.id)",
-            "CREATE INDEX node_id IF NOT EXISTS FOR (n:Team) ON (n.id)",
+            f"CREATE INDEX {_quote_identifier(f'node_id_{label}')} IF NOT EXISTS "
+            f"FOR (n:{_quote_identifier(label)}) ON (n.id)"
+            for label in labels
         ]
         
         with self.session() as session:
             for index_query in indexes:
                 try:
-                    session.run(index_query)
+                    session.execute_write(_run_and_consume, index_query)
                 except Exception:
                     # Index might already exist
                     pass
@@ -303,11 +650,7 @@ class GraphStorage:
         
         Converts to PascalCase and removes invalid characters.
         """
-        # Remove common prefixes and clean up
-        label = label.replace("-", "_").replace(" ", "_")
-        # Convert to PascalCase
-        parts = label.split("_")
-        return "".join(part.capitalize() for part in parts)
+        return _sanitize_label(label)
     
     def _sanitize_relationship(self, rel_type: str) -> str:
         """
@@ -315,9 +658,9 @@ class GraphStorage:
         
         Converts to UPPER_SNAKE_CASE.
         """
-        return rel_type.upper().replace("-", "_").replace(" ", "_")
+        return _sanitize_relationship(rel_type)
     
-    def _flatten_properties(self, properties: dict[str, Any]) -> dict[str, Any]:
+    def _flatten_properties(self, properties: Mapping[str, Any]) -> dict[str, Any]:
         """
         Flatten nested properties for Neo4j storage.
         
@@ -326,12 +669,9 @@ class GraphStorage:
         """
         flat = {}
         for key, value in properties.items():
-            if isinstance(value, dict):
-                # Serialize dicts to JSON strings
-                flat[key] = json.dumps(value)
-            elif isinstance(value, list) and value and isinstance(value[0], dict):
-                # Serialize list of dicts to JSON strings
-                flat[key] = json.dumps(value)
+            # Serialize dicts and lists of dicts to JSON strings
+            if isinstance(value, dict) or (isinstance(value, list) and value and isinstance(value[0], dict)):
+                flat[key] = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
             else:
                 flat[key] = value
         return flat